@@ -1,16 +1,47 @@
-from typing import Any
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Final
 
 import anthropic
+import httpx
 
+logger = logging.getLogger(__name__)
 
-class AIGenerator:
-    """Handles interactions with Anthropic's Claude API for generating responses"""
+# Connection pool shared by every AIGenerator so TCP/TLS connections are reused
+_shared_http_client: httpx.AsyncClient | None = None
+
+
+def get_shared_http_client() -> httpx.AsyncClient:
+    """Return the shared HTTP client, creating it on first use"""
+    global _shared_http_client
+    if _shared_http_client is None or _shared_http_client.is_closed:
+        _shared_http_client = anthropic.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            timeout=60.0,
+        )
+    return _shared_http_client
 
-    # Maximum number of sequential tool calling rounds
-    MAX_TOOL_ROUNDS = 2
 
-    # Static system prompt to avoid rebuilding on each call
-    SYSTEM_PROMPT = """ You are an AI assistant specialized in course materials and educational content with access to tools for course information.
+async def close_shared_http_client() -> None:
+    """Close the shared HTTP client's connections (call on app shutdown)"""
+    global _shared_http_client
+    if _shared_http_client is not None:
+        await _shared_http_client.aclose()
+        _shared_http_client = None
+
+
+# Static system prompt, built once so the cached prefix is byte-identical
+_SYSTEM_PROMPT: Final[str] = """\
+ You are an AI assistant specialized in course materials and educational content with access to tools for course information.
 
 Multi-Step Tool Usage:
 - You may use tools up to 2 times per query when complex questions require multiple lookups
@@ -46,19 +77,171 @@ All responses must be:
 Provide only the direct answer to what was asked.
 """
 
-    def __init__(self, api_key: str, model: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+# Trimmed prompt for SIMPLE queries, which are answered without tools
+_SYSTEM_PROMPT_SIMPLE: Final[str] = """\
+You are an AI assistant for course materials and educational content.
+Reply briefly and clearly, providing only the direct answer to what was asked."""
+
+# Cacheable system block shared by every COMPLEX request
+_SYSTEM_BLOCK: Final[dict[str, Any]] = {
+    "type": "text",
+    "text": _SYSTEM_PROMPT,
+    "cache_control": {"type": "ephemeral"},
+}
+
+
+@dataclass
+class LLMTurnMetrics:
+    """Latency and token usage for one generated response"""
+
+    query_len: int
+    model: str
+    tool_rounds: int = 0
+    api_ms: int = 0  # Time spent in Messages API calls
+    tool_exec_ms: int = 0  # Time spent running tools
+    total_ms: int = 0
+    first_token_ms: int | None = None  # Streaming only
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+    def add_usage(self, response) -> None:
+        """Add a response's token usage to the totals"""
+        self.input_tokens += response.usage.input_tokens
+        self.output_tokens += response.usage.output_tokens
+
+
+def _elapsed_ms(started: float) -> int:
+    """Milliseconds since a time.monotonic() reading"""
+    return int((time.monotonic() - started) * 1000)
+
+
+def _add_sources(
+    sources: list[dict[str, Any]], new_sources: list[dict[str, Any]]
+) -> None:
+    """Append the sources of a tool call that are not already cited"""
+    for source in new_sources:
+        if source not in sources:
+            sources.append(source)
+
+
+class AIGenerator:
+    """Handles interactions with Anthropic's Claude API for generating responses"""
+
+    # Maximum number of sequential tool calling rounds
+    MAX_TOOL_ROUNDS = 2
+
+    # Sampling settings shared by every request
+    TEMPERATURE = 0
+    MAX_TOKENS = 800
+
+    # batch_generate uses the Message Batches API from this many queries up
+    BATCH_API_MIN_QUERIES = 16
+
+    # Seconds between batch status checks
+    BATCH_POLL_INTERVAL = 5.0
+
+    # Framing for course questions sent along with the search tools
+    COURSE_QUERY_TEMPLATE = "Answer this question about course materials: {query}"
+
+    # Queries at least this long are always routed as COMPLEX
+    SIMPLE_QUERY_MAX_CHARS = 40
+
+    # Vocabulary that suggests a query needs the course tools
+    COURSE_KEYWORDS = re.compile(
+        r"\b(course|lesson|outline|module|syllabus|instructor)s?\b", re.IGNORECASE
+    )
+
+    # Greetings and acknowledgements that never need the course tools; a
+    # query must consist of these alone, e.g. "Hi there!" or "Thanks, that helps"
+    _SMALL_TALK_PHRASE = (
+        r"(hi|hello|hey|thanks|thank you|bye|goodbye|ok|okay|yes|no|cool|great"
+        r"|got it|that helps|how are you)( there| everyone| so much)?"
+    )
+    SMALL_TALK = re.compile(
+        rf"{_SMALL_TALK_PHRASE}([\s!.,?]+{_SMALL_TALK_PHRASE})*[\s!.,?]*",
+        re.IGNORECASE,
+    )
+
+    # A single lesson named in a question, e.g. "lesson 3"
+    LESSON_REFERENCE = re.compile(r"\blesson\s+(\d+)\b", re.IGNORECASE)
+
+    # Threads available for running tool calls
+    TOOL_WORKERS = 8
+
+    # Longest conversation history, in characters, sent with a request
+    MAX_HISTORY_CHARS = 4000
+
+    # Number of completed responses kept in the in-process response cache
+    RESPONSE_CACHE_SIZE = 256
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        simple_model: str | None = None,
+        max_retries: int = 4,
+        max_concurrency: int = 16,
+    ):
+        # The SDK retries 408/409/429/5xx and connection errors with jittered
+        # exponential backoff, honouring retry-after headers
+        self.client = anthropic.AsyncAnthropic(
+            api_key=api_key,
+            http_client=get_shared_http_client(),
+            max_retries=max_retries,
+        )
         self.model = model
 
-        # Pre-build base API parameters
-        self.base_params = {"model": self.model, "temperature": 0, "max_tokens": 800}
+        # Cap on API calls in flight, to stay under the account's rate limits
+        self._api_slots = asyncio.Semaphore(max_concurrency)
+
+        # Dedicated threads for tool calls, so vector searches never block the
+        # event loop or compete with other to_thread work
+        self._tool_executor = ThreadPoolExecutor(
+            max_workers=self.TOOL_WORKERS, thread_name_prefix="tool"
+        )
 
-    def generate_response(
+        # Model routing: COMPLEX queries use the main model, SIMPLE queries the
+        # cheaper one (routing is disabled when no simple model is given)
+        self.model_complex = model
+        self.model_simple = simple_model
+
+        # LRU cache of final answers for history-free requests
+        self._cache: OrderedDict[bytes, str] = OrderedDict()
+
+        # Tool-free requests currently being answered, keyed like the cache
+        self._inflight: dict[bytes, asyncio.Task[str]] = {}
+
+        # Tools registered with set_tools, with their cache key digest
+        self._tools: list | None = None
+        self._tools_digest: str | None = None
+
+    def set_tools(self, tools: list) -> None:
+        """
+        Register the tools offered by default with every COMPLEX request.
+
+        The cacheable copy of the schemas and its digest for the response
+        cache are built once here instead of on every call.
+
+        Args:
+            tools: Tool definitions (left unmodified); an empty list clears
+                the registered tools
+        """
+        if not tools:
+            self._tools = None
+            self._tools_digest = None
+            return
+        self._tools = self._with_cache_control(tools)
+        self._tools_digest = hashlib.blake2b(
+            json.dumps(self._tools, sort_keys=True).encode(), digest_size=16
+        ).hexdigest()
+
+    async def generate_response(
         self,
         query: str,
         conversation_history: str | None = None,
         tools: list | None = None,
         tool_manager=None,
+        sources: list[dict[str, Any]] | None = None,
     ) -> str:
         """
         Generate AI response with optional multi-round tool usage.
@@ -70,141 +253,657 @@ Provide only the direct answer to what was asked.
         Args:
             query: The user's question or request
             conversation_history: Previous messages for context
-            tools: Available tools the AI can use
+            tools: Available tools the AI can use (defaults to the tools
+                registered with set_tools)
             tool_manager: Manager to execute tools
+            sources: List the sources of this response's tool calls are
+                appended to, kept per call so concurrent requests don't mix
 
         Returns:
             Generated response as string
         """
-        # Build system content
-        system_content = (
-            f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
-            if conversation_history
-            else self.SYSTEM_PROMPT
-        )
+        if sources is None:
+            sources = []
+        started = time.monotonic()
+        api_params, tools = self._prepare_request(query, conversation_history, tools)
+
+        # Serve repeated history-free requests from the response cache
+        cache_key = None
+        if not conversation_history:
+            cache_key = self._cache_key(api_params)
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                self._cache.move_to_end(cache_key)
+                return cached
+
+        metrics = LLMTurnMetrics(query_len=len(query), model=api_params["model"])
+
+        # Collapse concurrent identical tool-free requests into one API call
+        # (no tools run, so there are no sources to collect)
+        if cache_key is not None and "tools" not in api_params:
+            task = self._inflight.get(cache_key)
+            if task is not None:
+                # Shielded so one caller's cancellation doesn't fail the others
+                return await asyncio.shield(task)
+            task = asyncio.create_task(
+                self._complete(api_params, tools, tool_manager, cache_key, metrics, [])
+            )
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
+            answer = await asyncio.shield(task)
+        else:
+            answer = await self._complete(
+                api_params, tools, tool_manager, cache_key, metrics, sources
+            )
 
-        # Initialize messages with user query
-        messages = [{"role": "user", "content": query}]
+        self._log_metrics(metrics, started)
+        return answer
 
-        # Prepare API call parameters
-        api_params = {
-            **self.base_params,
-            "messages": messages,
-            "system": system_content,
-        }
+    async def _complete(
+        self,
+        api_params: dict[str, Any],
+        tools: list | None,
+        tool_manager,
+        cache_key: bytes | None,
+        metrics: LLMTurnMetrics,
+        sources: list[dict[str, Any]],
+    ) -> str:
+        """
+        Run a prepared request through any tool rounds to the final answer.
 
-        # Add tools if available
-        if tools:
-            api_params["tools"] = tools
-            api_params["tool_choice"] = {"type": "auto"}
+        Args:
+            api_params: Parameters of the first API call
+            tools: Tool definitions for later rounds
+            tool_manager: Manager to execute tools
+            cache_key: Response cache key, or None if the answer isn't cacheable
+            metrics: Metrics of the current response
+            sources: List the tool calls' sources are appended to
 
+        Returns:
+            Final response text
+        """
         # Get initial response from Claude
-        response = self.client.messages.create(**api_params)
-
-        # Handle tool execution loop if needed
-        if response.stop_reason == "tool_use" and tool_manager and tools:
-            return self._continue_tool_loop(
-                response=response,
-                messages=messages,
-                system=system_content,
-                tools=tools,
-                tool_manager=tool_manager,
-                depth=1,
+        response = await self._create_message(api_params, metrics)
+        depth = 0
+
+        # Run tool rounds until Claude stops asking or no more tools are offered
+        while (
+            response.stop_reason == "tool_use"
+            and "tools" in api_params
+            and tool_manager
+        ):
+            depth += 1
+            tools_started = time.monotonic()
+            api_params = await self._run_tool_round(
+                response, api_params, tools, tool_manager, depth, sources
             )
+            metrics.tool_exec_ms += _elapsed_ms(tools_started)
+            response = await self._create_message(api_params, metrics)
+
+        metrics.tool_rounds = depth
+
+        # Cache the answer only when no tools ran (tool results may change)
+        answer = self._extract_text_response(response)
+        if cache_key is not None and depth == 0 and response.stop_reason != "tool_use":
+            self._cache_response(cache_key, answer)
+        return answer
+
+    async def batch_generate(self, queries: list[str]) -> list[str]:
+        """
+        Generate responses for several independent queries.
+
+        Small sets run concurrently against the Messages API. Sets of at least
+        BATCH_API_MIN_QUERIES go through the Message Batches API, which is
+        cheaper for offline workloads such as evaluation runs.
+
+        Args:
+            queries: User questions, answered without history or tools
+
+        Returns:
+            Response strings in the same order as the queries
+        """
+        if len(queries) >= self.BATCH_API_MIN_QUERIES:
+            return await self._generate_with_batches_api(queries)
+        return list(
+            await asyncio.gather(
+                *(self.generate_response(query, tools=[]) for query in queries)
+            )
+        )
+
+    async def _generate_with_batches_api(self, queries: list[str]) -> list[str]:
+        """
+        Submit queries as one message batch and wait for it to finish.
+
+        Requests that error or expire in the batch are retried through
+        generate_response.
+
+        Args:
+            queries: User questions, answered without history or tools
+
+        Returns:
+            Response strings in the same order as the queries
+        """
+        batches = self.client.messages.batches
+        batch = await batches.create(
+            requests=[
+                {
+                    "custom_id": str(i),
+                    "params": self._prepare_request(query, None, [])[0],
+                }
+                for i, query in enumerate(queries)
+            ]
+        )
+        while batch.processing_status != "ended":
+            await asyncio.sleep(self.BATCH_POLL_INTERVAL)
+            batch = await batches.retrieve(batch.id)
+
+        answers: list[str | None] = [None] * len(queries)
+        async for item in await batches.results(batch.id):
+            if item.result.type == "succeeded":
+                answers[int(item.custom_id)] = self._extract_text_response(
+                    item.result.message
+                )
+
+        missing = [i for i, answer in enumerate(answers) if answer is None]
+        retried = await asyncio.gather(
+            *(self.generate_response(queries[i], tools=[]) for i in missing)
+        )
+        for i, answer in zip(missing, retried, strict=True):
+            answers[i] = answer
+
+        return answers
+
+    async def generate_response_stream(
+        self,
+        query: str,
+        conversation_history: str | None = None,
+        tools: list | None = None,
+        tool_manager=None,
+        sources: list[dict[str, Any]] | None = None,
+    ) -> AsyncIterator[str | None]:
+        """
+        Stream the AI response as text deltas, with the same tool rounds as
+        generate_response.
+
+        Each round is streamed. Tool calls start as soon as their tool_use
+        block is complete in the stream, overlapping with the rest of the
+        generation; the completed message then collects their results before
+        the next round is streamed. Text Claude writes before using tools
+        ("Let me search...") is not part of the answer, so a round that ends
+        in tool use after streaming text is followed by None, telling the
+        caller to discard the text so far.
+
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use (defaults to the tools
+                registered with set_tools)
+            tool_manager: Manager to execute tools
+            sources: List the sources of this response's tool calls are
+                appended to, kept per call so concurrent requests don't mix
+
+        Yields:
+            Text fragments as Claude produces them, and None when the text
+            so far preceded a tool round
+        """
+        if sources is None:
+            sources = []
+        started = time.monotonic()
+        api_params, tools = self._prepare_request(query, conversation_history, tools)
+        metrics = LLMTurnMetrics(query_len=len(query), model=api_params["model"])
+        depth = 0
+
+        while True:
+            # Tools can only run this round if they were offered to Claude
+            can_run_tools = "tools" in api_params and tool_manager
+            early_tools: dict[str, asyncio.Task[tuple[str, list]]] = {}
+            streamed_text = False
+
+            try:
+                async with (
+                    self._api_slots,
+                    self.client.messages.stream(**api_params) as stream,
+                ):
+                    api_started = time.monotonic()
+                    async for event in stream:
+                        if event.type == "text":
+                            if metrics.first_token_ms is None:
+                                metrics.first_token_ms = _elapsed_ms(started)
+                            streamed_text = True
+                            yield event.text
+                        elif (
+                            event.type == "content_block_stop"
+                            and event.content_block.type == "tool_use"
+                            and can_run_tools
+                        ):
+                            # Start the tool as soon as its input is complete,
+                            # while Claude may still be generating
+                            block = event.content_block
+                            early_tools[block.id] = asyncio.create_task(
+                                self._run_tool(tool_manager, block.name, **block.input)
+                            )
+                    response = await stream.get_final_message()
+                metrics.api_ms += _elapsed_ms(api_started)
+                metrics.add_usage(response)
+
+                # Termination: no tool use requested, or none allowed
+                if (
+                    response.stop_reason != "tool_use"
+                    or "tools" not in api_params
+                    or not tool_manager
+                ):
+                    break
+                if streamed_text:
+                    yield None
+
+                depth += 1
+                tools_started = time.monotonic()
+                api_params = await self._run_tool_round(
+                    response,
+                    api_params,
+                    tools,
+                    tool_manager,
+                    depth,
+                    sources,
+                    early_tools,
+                )
+                metrics.tool_exec_ms += _elapsed_ms(tools_started)
+            finally:
+                # Tool calls the round never collected, because Claude stopped
+                # for another reason or the stream failed, are abandoned
+                for task in early_tools.values():
+                    task.cancel()
+
+        metrics.tool_rounds = depth
+        self._log_metrics(metrics, started)
+
+    async def _create_message(
+        self, api_params: dict[str, Any], metrics: LLMTurnMetrics
+    ):
+        """
+        Call the Messages API, waiting for a free slot under max_concurrency.
+
+        Args:
+            api_params: Parameters for messages.create
+            metrics: Metrics of the current response, updated with the call's
+                latency and token usage
 
-        # Return direct response (no tool use)
-        return self._extract_text_response(response)
+        Returns:
+            The API response
+        """
+        async with self._api_slots:
+            api_started = time.monotonic()
+            response = await self.client.messages.create(**api_params)
+        metrics.api_ms += _elapsed_ms(api_started)
+        metrics.add_usage(response)
+        return response
+
+    def _log_metrics(self, metrics: LLMTurnMetrics, started: float) -> None:
+        """Finish a response's metrics and emit them as a structured log line"""
+        metrics.total_ms = _elapsed_ms(started)
+        fields = asdict(metrics)
+        logger.info(
+            "llm_turn %s",
+            " ".join(f"{key}={value}" for key, value in fields.items()),
+            extra=fields,
+        )
 
-    def _continue_tool_loop(
+    async def _run_tool_round(
         self,
         response,
-        messages: list[dict[str, Any]],
-        system: str,
+        api_params: dict[str, Any],
         tools: list,
         tool_manager,
         depth: int,
-    ) -> str:
+        sources: list[dict[str, Any]],
+        early_tools: dict[str, asyncio.Task[tuple[str, list]]] | None = None,
+    ) -> dict[str, Any]:
         """
-        Recursively handle tool execution rounds.
+        Execute one round of tool calls and prepare the next API call.
+
+        The assistant turn and tool results are appended in place to the
+        request's message list, which is reused for the next call.
 
         Args:
             response: The API response containing tool_use blocks
-            messages: Current conversation messages (will be copied, not mutated)
-            system: System prompt
+            api_params: Parameters of the call that produced the response
             tools: Tool definitions
             tool_manager: Manager to execute tools
             depth: Current round number (1-based)
+            sources: List the round's tool sources are appended to
+            early_tools: Tool calls already started while streaming, by
+                tool_use id
 
         Returns:
-            Final response text
+            Parameters for the next API call, with tools only if more rounds
+            are allowed
         """
-        # Copy messages (immutable approach)
-        new_messages = messages.copy()
-
-        # Add Claude's response containing tool_use blocks
-        new_messages.append({"role": "assistant", "content": response.content})
+        messages = api_params["messages"]
+        messages.append({"role": "assistant", "content": response.content})
 
         # Execute all tool calls and collect results
-        tool_results = []
-        has_error = False
+        tool_results, has_error = await self._execute_tool_calls(
+            response, tool_manager, sources, early_tools
+        )
 
-        for content_block in response.content:
-            if content_block.type == "tool_use":
-                try:
-                    tool_result = tool_manager.execute_tool(
-                        content_block.name, **content_block.input
-                    )
-                    tool_results.append(
-                        {
-                            "type": "tool_result",
-                            "tool_use_id": content_block.id,
-                            "content": tool_result,
-                        }
-                    )
-                except Exception as e:
-                    # Mark error but continue with other tools
-                    tool_results.append(
-                        {
-                            "type": "tool_result",
-                            "tool_use_id": content_block.id,
-                            "content": f"Error executing tool: {str(e)}",
-                            "is_error": True,
-                        }
-                    )
-                    has_error = True
-
-        # Add tool results to messages
-        if tool_results:
-            new_messages.append({"role": "user", "content": tool_results})
+        # Pipeline an outline lookup straight into the follow-up lesson search
+        prefetched = None
+        if depth == 1 and not has_error:
+            prefetched = await self._prefetch_lesson_search(
+                response, tool_results, messages[0]["content"], tools, tool_manager
+            )
+            if prefetched:
+                lesson_content, lesson_sources = prefetched
+                _add_sources(sources, lesson_sources)
+                tool_results.append(
+                    {"type": "text", "text": f"Lesson content:\n{lesson_content}"}
+                )
 
-        # Determine if we should allow more tool calls
-        allow_more_tools = depth < self.MAX_TOOL_ROUNDS and not has_error
+        if tool_results:
+            messages.append({"role": "user", "content": tool_results})
 
-        # Prepare next API call
-        next_params = {**self.base_params, "messages": new_messages, "system": system}
+        next_params = {
+            "model": self.model,
+            "temperature": self.TEMPERATURE,
+            "max_tokens": self.MAX_TOKENS,
+            "messages": messages,
+            "system": api_params["system"],
+        }
 
-        # Only include tools if we're allowing more rounds
-        if allow_more_tools:
+        # Only include tools if we're allowing more rounds (a prefetched
+        # search stands in for the next round)
+        if depth < self.MAX_TOOL_ROUNDS and not has_error and not prefetched:
             next_params["tools"] = tools
             next_params["tool_choice"] = {"type": "auto"}
 
-        # Make the next API call
-        next_response = self.client.messages.create(**next_params)
-
-        # Check if Claude wants more tools AND we allow it
-        if next_response.stop_reason == "tool_use" and allow_more_tools:
-            # Recursive call for next round
-            return self._continue_tool_loop(
-                response=next_response,
-                messages=new_messages,
-                system=system,
-                tools=tools,
-                tool_manager=tool_manager,
-                depth=depth + 1,
+        return next_params
+
+    async def _prefetch_lesson_search(
+        self,
+        response,
+        tool_results: list[dict[str, Any]],
+        query: str,
+        tools,
+        tool_manager,
+    ) -> tuple[str, list[dict[str, Any]]] | None:
+        """
+        Run the lesson search Claude would ask for after a course outline.
+
+        Applies when the only tool call was a successful get_course_outline
+        and the question names a single lesson. Searching that lesson now lets
+        the next call answer directly instead of spending a tool round on it.
+
+        Args:
+            response: The API response containing tool_use blocks
+            tool_results: Results of the response's tool calls
+            query: The first user message of the request
+            tools: Tool definitions offered to Claude
+            tool_manager: Manager to execute tools
+
+        Returns:
+            Tuple of (search results for the lesson, their sources), or None if
+            the search was not run
+        """
+        tool_uses = [block for block in response.content if block.type == "tool_use"]
+        if len(tool_uses) != 1 or tool_uses[0].name != "get_course_outline":
+            return None
+        if not any(tool.get("name") == "search_course_content" for tool in tools):
+            return None
+
+        lesson_numbers = set(self.LESSON_REFERENCE.findall(query))
+        outline = tool_results[0]["content"]
+        if len(lesson_numbers) != 1 or not outline.startswith("Course: "):
+            return None
+
+        course_title = outline.splitlines()[0].removeprefix("Course: ")
+        question = query.removeprefix(self.COURSE_QUERY_TEMPLATE.format(query=""))
+        try:
+            return await self._run_tool(
+                tool_manager,
+                "search_course_content",
+                query=question,
+                course_name=course_title,
+                lesson_number=int(lesson_numbers.pop()),
             )
+        except Exception:
+            # Fall back to a normal tool round
+            return None
+
+    def _classify(self, query: str, conversation_history: str | None = None) -> str:
+        """
+        Cheaply classify a query for model routing.
+
+        Short queries with no course vocabulary are SIMPLE when they are
+        nothing but greetings or acknowledgements ("hi, how are you?",
+        "thanks"). Anything else is COMPLEX, including small talk followed by
+        a question ("Hi, what is MCP?"), as are course keywords, prior
+        conversation and the lack of a simple model.
+
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+
+        Returns:
+            "SIMPLE" or "COMPLEX"
+        """
+        if not self.model_simple or conversation_history:
+            return "COMPLEX"
+        too_long = len(query) >= self.SIMPLE_QUERY_MAX_CHARS
+        if too_long or self.COURSE_KEYWORDS.search(query):
+            return "COMPLEX"
+        if self.SMALL_TALK.fullmatch(query.strip()):
+            return "SIMPLE"
+        return "COMPLEX"
+
+    def _prepare_request(
+        self, query: str, conversation_history: str | None, tools: list | None
+    ) -> tuple[dict[str, Any], list | None]:
+        """
+        Route a query and build the parameters for its first API call.
+
+        SIMPLE queries go to the simple model with the trimmed prompt and no
+        tools. COMPLEX queries use the main model and full prompt; when tools
+        are offered, the query is framed as a course question and the tool
+        schemas are marked cacheable (registered tools already are).
+
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use, or None for the registered
+                tools
+
+        Returns:
+            Tuple of (API parameters, tools for later rounds or None)
+        """
+        if self._classify(query, conversation_history) == "SIMPLE":
+            api_params = {
+                "model": self.model_simple,
+                "temperature": self.TEMPERATURE,
+                "max_tokens": self.MAX_TOKENS,
+                "messages": [{"role": "user", "content": query}],
+                "system": _SYSTEM_PROMPT_SIMPLE,
+            }
+            return api_params, None
+
+        if tools is None:
+            tools = self._tools
+        elif tools:
+            tools = self._with_cache_control(tools)
+        if tools:
+            query = self.COURSE_QUERY_TEMPLATE.format(query=query)
+
+        api_params = {
+            "model": self.model,
+            "temperature": self.TEMPERATURE,
+            "max_tokens": self.MAX_TOKENS,
+            "messages": [{"role": "user", "content": query}],
+            "system": self._build_system(conversation_history),
+        }
+        if tools:
+            api_params["tools"] = tools
+            api_params["tool_choice"] = {"type": "auto"}
+
+        return api_params, tools
+
+    def _cache_key(self, api_params: dict[str, Any]) -> bytes:
+        """
+        Hash the parts of a request that determine its answer.
+
+        Args:
+            api_params: Parameters of the first API call
+
+        Returns:
+            16-byte digest of the model, system content, query and tools
+        """
+        # Registered tools are represented by their precomputed digest
+        tools = api_params.get("tools")
+        if tools is not None and tools is self._tools:
+            tools = self._tools_digest
+
+        payload = json.dumps(
+            [
+                api_params["model"],
+                api_params["system"],
+                api_params["messages"][0]["content"],
+                tools,
+            ],
+            sort_keys=True,
+        )
+        return hashlib.blake2b(payload.encode(), digest_size=16).digest()
+
+    def _cache_response(self, cache_key: bytes, answer: str) -> None:
+        """Store an answer, evicting the least recently used entry when full"""
+        self._cache[cache_key] = answer
+        self._cache.move_to_end(cache_key)
+        if len(self._cache) > self.RESPONSE_CACHE_SIZE:
+            self._cache.popitem(last=False)
+
+    def _build_system(self, conversation_history: str | None) -> list[dict[str, Any]]:
+        """
+        Build the system content blocks for a request.
+
+        The static prompt is a cacheable prefix; per-session history goes in a
+        separate uncached block after it, trimmed to MAX_HISTORY_CHARS.
+
+        Args:
+            conversation_history: Previous messages for context
+
+        Returns:
+            List of system text blocks
+        """
+        if not conversation_history:
+            return [_SYSTEM_BLOCK]
+        history = self._trim_history(conversation_history)
+        return [
+            _SYSTEM_BLOCK,
+            {"type": "text", "text": f"Previous conversation:\n{history}"},
+        ]
+
+    def _trim_history(self, history: str) -> str:
+        """
+        Keep the most recent part of the history that fits MAX_HISTORY_CHARS.
+
+        The cut is moved forward to the start of a user message so the kept
+        history never opens mid-exchange.
+
+        Args:
+            history: Formatted conversation ("User: ...\nAssistant: ...")
+
+        Returns:
+            The history, or its trailing whole exchanges if it is too long
+        """
+        if len(history) <= self.MAX_HISTORY_CHARS:
+            return history
+        tail = history[-self.MAX_HISTORY_CHARS :]
+        boundary = tail.find("\nUser:")
+        return tail if boundary == -1 else tail[boundary + 1 :]
+
+    async def _execute_tool_calls(
+        self,
+        response,
+        tool_manager,
+        sources: list[dict[str, Any]],
+        early_tools: dict[str, asyncio.Task[tuple[str, list]]] | None = None,
+    ) -> tuple[list[dict[str, Any]], bool]:
+        """
+        Execute every tool_use block in a response concurrently.
+
+        Tools are synchronous (vector store lookups), so each one runs on the
+        tool thread pool; results keep the order of the tool_use blocks.
 
-        # Termination: extract text response
-        return self._extract_text_response(next_response)
+        Args:
+            response: The API response containing tool_use blocks
+            tool_manager: Manager to execute tools
+            sources: List the tools' sources are appended to, in block order
+            early_tools: Tool calls already started while streaming, by
+                tool_use id; these are awaited instead of run again
+
+        Returns:
+            Tuple of (tool_result blocks, whether any tool raised)
+        """
+        early_tools = early_tools or {}
+        tool_uses = [block for block in response.content if block.type == "tool_use"]
+        outcomes = await asyncio.gather(
+            *(
+                early_tools.get(block.id)
+                or self._run_tool(tool_manager, block.name, **block.input)
+                for block in tool_uses
+            ),
+            return_exceptions=True,
+        )
+
+        tool_results = []
+        has_error = False
+
+        for content_block, outcome in zip(tool_uses, outcomes, strict=True):
+            if isinstance(outcome, Exception):
+                # Mark error but keep the other tools' results
+                tool_results.append(
+                    {
+                        "type": "tool_result",
+                        "tool_use_id": content_block.id,
+                        "content": f"Error executing tool: {str(outcome)}",
+                        "is_error": True,
+                    }
+                )
+                has_error = True
+            else:
+                text, tool_sources = outcome
+                _add_sources(sources, tool_sources)
+                tool_results.append(
+                    {
+                        "type": "tool_result",
+                        "tool_use_id": content_block.id,
+                        "content": text,
+                    }
+                )
+
+        return tool_results, has_error
+
+    async def _run_tool(
+        self, tool_manager, tool_name: str, /, **kwargs
+    ) -> tuple[str, list[dict[str, Any]]]:
+        """Run a synchronous tool on the tool thread pool, off the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._tool_executor,
+            functools.partial(tool_manager.execute_tool, tool_name, **kwargs),
+        )
+
+    def _with_cache_control(self, tools: list) -> list:
+        """
+        Return a copy of the tool list with a cache breakpoint on the last tool.
+
+        Anthropic caches everything up to and including the marked block, so
+        marking the final tool caches the whole tool schema prefix.
+
+        Args:
+            tools: Tool definitions (left unmodified)
+
+        Returns:
+            New tool list with cache_control set on its last entry
+        """
+        return [*tools[:-1], {**tools[-1], "cache_control": {"type": "ephemeral"}}]
 
     def _extract_text_response(self, response) -> str:
         """
@@ -216,7 +915,8 @@ Provide only the direct answer to what was asked.
         Returns:
             Text content from the response, or empty string if none found
         """
-        for block in response.content:
-            if hasattr(block, "text"):
+        # The text block normally comes last, after any tool_use blocks
+        for block in reversed(response.content):
+            if block.type == "text":
                 return block.text
         return ""
@@ -2,18 +2,48 @@ import warnings
 
 warnings.filterwarnings("ignore", message="resource_tracker: There appear to be.*")
 
+import json
 import os
+from contextlib import asynccontextmanager
+from typing import Annotated
 
+from ai_generator import close_shared_http_client
 from config import config
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from rag_system import RAGSystem
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the process-wide RAG system, load documents, and clean up on exit"""
+    rag_system = RAGSystem(config)
+    app.state.rag_system = rag_system
+
+    # Load initial documents
+    docs_path = "../docs"
+    if os.path.exists(docs_path):
+        print("Loading initial documents...")
+        try:
+            courses, chunks = rag_system.add_course_folder(
+                docs_path, clear_existing=False
+            )
+            print(f"Loaded {courses} courses with {chunks} chunks")
+        except Exception as e:
+            print(f"Error loading documents: {e}")
+
+    yield
+
+    # Close pooled connections to the Anthropic API
+    await close_shared_http_client()
+
+
 # Initialize FastAPI app
-app = FastAPI(title="Course Materials RAG System", root_path="")
+app = FastAPI(title="Course Materials RAG System", root_path="", lifespan=lifespan)
 
 # Add trusted host middleware for proxy
 app.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
@@ -28,8 +58,13 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
-# Initialize RAG system
-rag_system = RAGSystem(config)
+
+def get_rag_system(request: Request) -> RAGSystem:
+    """Return the RAG system shared by every request"""
+    return request.app.state.rag_system
+
+
+RAGSystemDep = Annotated[RAGSystem, Depends(get_rag_system)]
 
 
 # Pydantic models for request/response
@@ -66,7 +101,7 @@ class CourseStats(BaseModel):
 
 
 @app.post("/api/query", response_model=QueryResponse)
-async def query_documents(request: QueryRequest):
+async def query_documents(request: QueryRequest, rag_system: RAGSystemDep):
     """Process a query and return response with sources"""
     try:
         # Create session if not provided
@@ -75,7 +110,7 @@ async def query_documents(request: QueryRequest):
             session_id = rag_system.session_manager.create_session()
 
         # Process query using RAG system
-        answer, sources = rag_system.query(request.query, session_id)
+        answer, sources = await rag_system.query(request.query, session_id)
 
         return QueryResponse(
             answer=answer,
@@ -86,8 +121,28 @@ async def query_documents(request: QueryRequest):
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 
+@app.post("/api/query/stream")
+async def query_documents_stream(request: QueryRequest, rag_system: RAGSystemDep):
+    """Process a query and stream the response as server-sent events"""
+    session_id = request.session_id
+    if not session_id:
+        session_id = rag_system.session_manager.create_session()
+
+    async def event_stream():
+        try:
+            async for event in rag_system.query_stream(request.query, session_id):
+                if event["type"] == "done":
+                    event = {**event, "session_id": session_id}
+                yield f"data: {json.dumps(event)}\n\n"
+        except Exception as e:
+            # Headers are already sent, so report failures in-band
+            yield f"data: {json.dumps({'type': 'error', 'detail': str(e)})}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @app.get("/api/courses", response_model=CourseStats)
-async def get_course_stats():
+async def get_course_stats(rag_system: RAGSystemDep):
     """Get course analytics and statistics"""
     try:
         analytics = rag_system.get_course_analytics()
@@ -99,21 +154,6 @@ async def get_course_stats():
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 
-@app.on_event("startup")
-async def startup_event():
-    """Load initial documents on startup"""
-    docs_path = "../docs"
-    if os.path.exists(docs_path):
-        print("Loading initial documents...")
-        try:
-            courses, chunks = rag_system.add_course_folder(
-                docs_path, clear_existing=False
-            )
-            print(f"Loaded {courses} courses with {chunks} chunks")
-        except Exception as e:
-            print(f"Error loading documents: {e}")
-
-
 # Custom static file handler with no-cache headers for development
 
 from fastapi.responses import FileResponse
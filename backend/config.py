@@ -14,6 +14,9 @@ class Config:
     # Anthropic API settings
     ANTHROPIC_API_KEY: str = os.getenv("ANTHROPIC_API_KEY", "")
     ANTHROPIC_MODEL: str = "claude-sonnet-4-20250514"
+    ANTHROPIC_SIMPLE_MODEL: str = "claude-haiku-4-5-20251001"  # For SIMPLE queries
+    ANTHROPIC_MAX_RETRIES: int = 4  # Retries for rate limits and transient errors
+    ANTHROPIC_MAX_CONCURRENCY: int = 16  # API calls allowed in flight at once
 
     # Embedding model settings
     EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
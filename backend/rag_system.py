@@ -1,4 +1,6 @@
 import os
+from collections.abc import AsyncIterator
+from typing import Any
 
 from ai_generator import AIGenerator
 from document_processor import DocumentProcessor
@@ -22,7 +24,11 @@ class RAGSystem:
             config.CHROMA_PATH, config.EMBEDDING_MODEL, config.MAX_RESULTS
         )
         self.ai_generator = AIGenerator(
-            config.ANTHROPIC_API_KEY, config.ANTHROPIC_MODEL
+            config.ANTHROPIC_API_KEY,
+            config.ANTHROPIC_MODEL,
+            config.ANTHROPIC_SIMPLE_MODEL,
+            max_retries=config.ANTHROPIC_MAX_RETRIES,
+            max_concurrency=config.ANTHROPIC_MAX_CONCURRENCY,
         )
         self.session_manager = SessionManager(config.MAX_HISTORY)
 
@@ -33,6 +39,9 @@ class RAGSystem:
         self.outline_tool = CourseOutlineTool(self.vector_store)
         self.tool_manager.register_tool(self.outline_tool)
 
+        # Tool definitions are fixed, so hand them to the generator once
+        self.ai_generator.set_tools(self.tool_manager.get_tool_definitions())
+
     def add_course_document(self, file_path: str) -> tuple[Course, int]:
         """
         Add a single course document to the knowledge base.
@@ -118,7 +127,9 @@ class RAGSystem:
 
         return total_courses, total_chunks
 
-    def query(self, query: str, session_id: str | None = None) -> tuple[str, list[str]]:
+    async def query(
+        self, query: str, session_id: str | None = None
+    ) -> tuple[str, list[dict[str, Any]]]:
         """
         Process a user query using the RAG system with tool-based search.
 
@@ -127,30 +138,24 @@ class RAGSystem:
             session_id: Optional session ID for conversation context
 
         Returns:
-            Tuple of (response, sources list - empty for tool-based approach)
+            Tuple of (response, sources cited by this query's tool calls)
         """
-        # Create prompt for the AI with clear instructions
-        prompt = f"""Answer this question about course materials: {query}"""
-
         # Get conversation history if session exists
         history = None
         if session_id:
             history = self.session_manager.get_conversation_history(session_id)
 
-        # Generate response using AI with tools
-        response = self.ai_generator.generate_response(
-            query=prompt,
+        # Generate response using AI with tools (the generator routes simple
+        # queries to a cheaper model without tools). Sources are collected for
+        # this query alone, since concurrent queries share the tool manager.
+        sources = []
+        response = await self.ai_generator.generate_response(
+            query=query,
             conversation_history=history,
-            tools=self.tool_manager.get_tool_definitions(),
             tool_manager=self.tool_manager,
+            sources=sources,
         )
 
-        # Get sources from the search tool
-        sources = self.tool_manager.get_last_sources()
-
-        # Reset sources after retrieving them
-        self.tool_manager.reset_sources()
-
         # Update conversation history
         if session_id:
             self.session_manager.add_exchange(session_id, query, response)
@@ -158,6 +163,47 @@ class RAGSystem:
         # Return response with sources from tool searches
         return response, sources
 
+    async def query_stream(
+        self, query: str, session_id: str | None = None
+    ) -> AsyncIterator[dict[str, Any]]:
+        """
+        Process a user query, streaming the response as it is generated.
+
+        Args:
+            query: User's question
+            session_id: Optional session ID for conversation context
+
+        Yields:
+            {"type": "text", "text": ...} events for each response fragment,
+            {"type": "reset"} when the text so far only led up to a tool
+            call and should be discarded, then a final
+            {"type": "done", "sources": [...]} event
+        """
+        history = None
+        if session_id:
+            history = self.session_manager.get_conversation_history(session_id)
+
+        chunks = []
+        sources = []
+        async for text in self.ai_generator.generate_response_stream(
+            query=query,
+            conversation_history=history,
+            tool_manager=self.tool_manager,
+            sources=sources,
+        ):
+            if text is None:
+                # Keep only the final answer, as query() does
+                chunks.clear()
+                yield {"type": "reset"}
+                continue
+            chunks.append(text)
+            yield {"type": "text", "text": text}
+
+        if session_id:
+            self.session_manager.add_exchange(session_id, query, "".join(chunks))
+
+        yield {"type": "done", "sources": sources}
+
     def get_course_analytics(self) -> dict:
         """Get analytics about the course catalog"""
         return {
@@ -13,8 +13,13 @@ class Tool(ABC):
         pass
 
     @abstractmethod
-    def execute(self, **kwargs) -> str:
-        """Execute the tool with given parameters"""
+    def execute(self, **kwargs) -> tuple[str, list[dict[str, Any]]]:
+        """
+        Execute the tool with given parameters.
+
+        Returns:
+            Tuple of (result text for Claude, sources to cite in the UI)
+        """
         pass
 
 
@@ -23,7 +28,6 @@ class CourseSearchTool(Tool):
 
     def __init__(self, vector_store: VectorStore):
         self.store = vector_store
-        self.last_sources = []  # Track sources from last search
 
     def get_tool_definition(self) -> dict[str, Any]:
         """Return Anthropic tool definition for this tool"""
@@ -55,7 +59,7 @@ class CourseSearchTool(Tool):
         query: str,
         course_name: str | None = None,
         lesson_number: int | None = None,
-    ) -> str:
+    ) -> tuple[str, list[dict[str, Any]]]:
         """
         Execute the search tool with given parameters.
 
@@ -65,7 +69,8 @@ class CourseSearchTool(Tool):
             lesson_number: Optional lesson filter
 
         Returns:
-            Formatted search results or error message
+            Tuple of (formatted search results or error message, sources of
+            the results shown)
         """
 
         # Use the vector store's unified search interface
@@ -75,7 +80,7 @@ class CourseSearchTool(Tool):
 
         # Handle errors
         if results.error:
-            return results.error
+            return results.error, []
 
         # Handle empty results
         if results.is_empty():
@@ -84,13 +89,15 @@ class CourseSearchTool(Tool):
                 filter_info += f" in course '{course_name}'"
             if lesson_number:
                 filter_info += f" in lesson {lesson_number}"
-            return f"No relevant content found{filter_info}."
+            return f"No relevant content found{filter_info}.", []
 
         # Format and return results
         return self._format_results(results)
 
-    def _format_results(self, results: SearchResults) -> str:
-        """Format search results with course and lesson context"""
+    def _format_results(
+        self, results: SearchResults
+    ) -> tuple[str, list[dict[str, Any]]]:
+        """Format search results with course and lesson context, and their sources"""
         formatted = []
         seen_sources = set()  # For deduplication
         sources = []  # Track sources with links for the UI
@@ -124,10 +131,7 @@ class CourseSearchTool(Tool):
 
             formatted.append(f"{header}\n{doc}")
 
-        # Store sources for retrieval
-        self.last_sources = sources
-
-        return "\n\n".join(formatted)
+        return "\n\n".join(formatted), sources
 
 
 class CourseOutlineTool(Tool):
@@ -135,7 +139,6 @@ class CourseOutlineTool(Tool):
 
     def __init__(self, vector_store: VectorStore):
         self.store = vector_store
-        self.last_sources = []  # Track sources for UI attribution
 
     def get_tool_definition(self) -> dict[str, Any]:
         """Return Anthropic tool definition for this tool"""
@@ -154,7 +157,7 @@ class CourseOutlineTool(Tool):
             },
         }
 
-    def execute(self, course_name: str) -> str:
+    def execute(self, course_name: str) -> tuple[str, list[dict[str, Any]]]:
         """
         Execute the outline tool to retrieve course structure.
 
@@ -162,20 +165,21 @@ class CourseOutlineTool(Tool):
             course_name: Course title or partial match
 
         Returns:
-            Formatted course outline with title, link, and lessons
+            Tuple of (formatted course outline with title, link, and lessons,
+            the course as a source)
         """
         import json
 
         # Resolve course name using semantic search
         resolved_title = self.store._resolve_course_name(course_name)
         if not resolved_title:
-            return f"No course found matching '{course_name}'"
+            return f"No course found matching '{course_name}'", []
 
         # Fetch course metadata from catalog
         try:
             results = self.store.course_catalog.get(ids=[resolved_title])
             if not results or not results["metadatas"] or not results["metadatas"][0]:
-                return f"Could not retrieve metadata for course '{resolved_title}'"
+                return f"Could not retrieve metadata for course '{resolved_title}'", []
 
             metadata = results["metadatas"][0]
             course_title = metadata.get("title", resolved_title)
@@ -202,13 +206,13 @@ class CourseOutlineTool(Tool):
                 if lesson_link:
                     output_lines.append(f"  Link: {lesson_link}")
 
-            # Track source for UI attribution
-            self.last_sources = [{"text": course_title, "url": course_link}]
+            # Cite the course for UI attribution
+            sources = [{"text": course_title, "url": course_link}]
 
-            return "\n".join(output_lines)
+            return "\n".join(output_lines), sources
 
         except Exception as e:
-            return f"Error retrieving course outline: {str(e)}"
+            return f"Error retrieving course outline: {str(e)}", []
 
 
 class ToolManager:
@@ -229,23 +233,19 @@ class ToolManager:
         """Get all tool definitions for Anthropic tool calling"""
         return [tool.get_tool_definition() for tool in self.tools.values()]
 
-    def execute_tool(self, tool_name: str, **kwargs) -> str:
-        """Execute a tool by name with given parameters"""
+    def execute_tool(
+        self, tool_name: str, **kwargs
+    ) -> tuple[str, list[dict[str, Any]]]:
+        """
+        Execute a tool by name with given parameters.
+
+        Sources are returned with each call rather than kept on the tools, so
+        concurrent requests sharing this manager never see each other's.
+
+        Returns:
+            Tuple of (result text, sources of this call)
+        """
         if tool_name not in self.tools:
-            return f"Tool '{tool_name}' not found"
+            return f"Tool '{tool_name}' not found", []
 
         return self.tools[tool_name].execute(**kwargs)
-
-    def get_last_sources(self) -> list:
-        """Get sources from the last search operation"""
-        # Check all tools for last_sources attribute
-        for tool in self.tools.values():
-            if hasattr(tool, "last_sources") and tool.last_sources:
-                return tool.last_sources
-        return []
-
-    def reset_sources(self):
-        """Reset sources from all tools that track sources"""
-        for tool in self.tools.values():
-            if hasattr(tool, "last_sources"):
-                tool.last_sources = []
@@ -6,16 +6,48 @@ This module provides common fixtures for:
 - Mocked RAG system components (VectorStore, AIGenerator, etc.)
 - Test data fixtures for search results and responses
 """
+import copy
 import pytest
-import sys
-import os
 from dataclasses import dataclass
-from unittest.mock import Mock, patch
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, create_autospec
 
-# Add parent directory to path for imports
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ai_generator import AIGenerator
+from document_processor import DocumentProcessor
+from rag_system import RAGSystem
+from session_manager import SessionManager
+from vector_store import SearchResults, VectorStore
 
-from vector_store import SearchResults
+# Shared, read-only results so fixtures don't rebuild them per test; the
+# search tools only read them
+EMPTY_SEARCH_RESULTS = SearchResults(
+    documents=[],
+    metadata=[],
+    distances=[],
+    error=None
+)
+
+SINGLE_SEARCH_RESULT = SearchResults(
+    documents=["This is lesson content about tool use."],
+    metadata=[{"course_title": "Test Course", "lesson_number": 1}],
+    distances=[0.5],
+    error=None
+)
+
+SAMPLE_SEARCH_RESULTS = SearchResults(
+    documents=[
+        "This is content about tool use in Claude.",
+        "More content about MCP protocol."
+    ],
+    metadata=[
+        {"course_title": "Tool Use Course", "lesson_number": 1},
+        {"course_title": "MCP Course", "lesson_number": 2}
+    ],
+    distances=[0.3, 0.5],
+    error=None
+)
+
+ERROR_SEARCH_RESULTS = SearchResults.empty("Search error: Database connection failed")
 
 
 @dataclass
@@ -23,6 +55,9 @@ class MockConfig:
     """Mock configuration for testing"""
     ANTHROPIC_API_KEY: str = "test-api-key"
     ANTHROPIC_MODEL: str = "claude-sonnet-4-20250514"
+    ANTHROPIC_SIMPLE_MODEL: str = "claude-haiku-4-5-20251001"
+    ANTHROPIC_MAX_RETRIES: int = 4
+    ANTHROPIC_MAX_CONCURRENCY: int = 16
     EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
     CHUNK_SIZE: int = 800
     CHUNK_OVERLAP: int = 100
@@ -37,16 +72,23 @@ def mock_config():
     return MockConfig()
 
 
+@pytest.fixture(scope='session')
+def _vector_store_template():
+    """One autospec'd VectorStore mock for the session, copied per test"""
+    return create_autospec(VectorStore, instance=True)
+
+
 @pytest.fixture
-def mock_vector_store():
-    """Provide a mocked VectorStore"""
-    store = Mock()
-    store.search.return_value = SearchResults(
-        documents=[],
-        metadata=[],
-        distances=[],
-        error=None
-    )
+def mock_vector_store(_vector_store_template):
+    """
+    Provide a mocked VectorStore.
+
+    A shallow copy shares its child mocks with the template, so the template
+    is reset (return values and side effects included) before each copy.
+    """
+    _vector_store_template.reset_mock(return_value=True, side_effect=True)
+    store = copy.copy(_vector_store_template)
+    store.search.return_value = EMPTY_SEARCH_RESULTS
     store.get_lesson_link.return_value = None
     store.get_course_count.return_value = 0
     store.get_existing_course_titles.return_value = []
@@ -56,15 +98,15 @@ def mock_vector_store():
 @pytest.fixture
 def mock_ai_generator():
     """Provide a mocked AIGenerator"""
-    generator = Mock()
-    generator.generate_response.return_value = "Test response"
+    generator = Mock(spec_set=AIGenerator)
+    generator.generate_response = AsyncMock(return_value="Test response")
     return generator
 
 
 @pytest.fixture
 def mock_session_manager():
     """Provide a mocked SessionManager"""
-    manager = Mock()
+    manager = Mock(spec_set=SessionManager)
     manager.create_session.return_value = "test-session-id"
     manager.get_conversation_history.return_value = None
     return manager
@@ -73,54 +115,47 @@ def mock_session_manager():
 @pytest.fixture
 def mock_document_processor():
     """Provide a mocked DocumentProcessor"""
-    processor = Mock()
-    processor.process_file.return_value = ([], [])
+    processor = Mock(spec_set=DocumentProcessor)
+    processor.process_course_document.return_value = (None, [])
     return processor
 
 
+@pytest.fixture
+def single_search_result():
+    """Provide one search hit from a single course lesson"""
+    return SINGLE_SEARCH_RESULT
+
+
 @pytest.fixture
 def sample_search_results():
     """Provide sample search results for testing"""
-    return SearchResults(
-        documents=[
-            "This is content about tool use in Claude.",
-            "More content about MCP protocol."
-        ],
-        metadata=[
-            {"course_title": "Tool Use Course", "lesson_number": 1},
-            {"course_title": "MCP Course", "lesson_number": 2}
-        ],
-        distances=[0.3, 0.5],
-        error=None
-    )
+    return SAMPLE_SEARCH_RESULTS
 
 
 @pytest.fixture
 def empty_search_results():
     """Provide empty search results for testing"""
-    return SearchResults(
-        documents=[],
-        metadata=[],
-        distances=[],
-        error=None
-    )
+    return EMPTY_SEARCH_RESULTS
 
 
 @pytest.fixture
 def error_search_results():
     """Provide search results with an error"""
-    return SearchResults(
-        documents=[],
-        metadata=[],
-        distances=[],
-        error="Database connection failed"
-    )
+    return ERROR_SEARCH_RESULTS
+
+
+@pytest.fixture(scope='session')
+def shared_rag_system():
+    """One RAGSystem mock for the whole session; reset per test by mock_rag_system"""
+    return Mock()
 
 
 @pytest.fixture
-def mock_rag_system():
+def mock_rag_system(shared_rag_system):
     """Provide a fully mocked RAGSystem for API testing"""
-    rag = Mock()
+    rag = shared_rag_system
+    rag.reset_mock(return_value=True, side_effect=True)
+    rag.query = AsyncMock()
     rag.query.return_value = (
         "This is a test response about the course.",
         [{"text": "Test Course - Lesson 1", "url": "https://example.com/lesson1"}]
@@ -129,26 +164,94 @@ def mock_rag_system():
         "total_courses": 3,
         "course_titles": ["Course A", "Course B", "Course C"]
     }
+    # Tests may swap in their own stream; start each one from a plain mock
+    rag.query_stream = Mock()
     rag.session_manager = Mock()
     rag.session_manager.create_session.return_value = "new-session-id"
     return rag
 
 
 @pytest.fixture
-def rag_system_patches():
-    """Context manager fixture that patches all RAG system dependencies"""
-    with patch('rag_system.VectorStore') as mock_vs, \
-         patch('rag_system.AIGenerator') as mock_ai, \
-         patch('rag_system.DocumentProcessor') as mock_dp, \
-         patch('rag_system.SessionManager') as mock_sm:
-
-        mock_sm.return_value.get_conversation_history.return_value = None
-        mock_sm.return_value.create_session.return_value = "test-session"
-        mock_ai.return_value.generate_response.return_value = "Test response"
-
-        yield {
-            'vector_store': mock_vs,
-            'ai_generator': mock_ai,
-            'document_processor': mock_dp,
-            'session_manager': mock_sm
+def make_rag_system(
+    monkeypatch,
+    mock_config,
+    mock_vector_store,
+    mock_ai_generator,
+    mock_session_manager,
+    mock_document_processor
+):
+    """
+    Factory fixture that builds a RAGSystem around injected components.
+
+    Components default to the mock fixtures above; pass keyword overrides
+    (vector_store, ai_generator, session_manager, document_processor) to
+    inject others. The component classes are swapped with monkeypatch and
+    restored at test teardown.
+    """
+    def make(config=None, **overrides):
+        components = {
+            'vector_store': mock_vector_store,
+            'ai_generator': mock_ai_generator,
+            'session_manager': mock_session_manager,
+            'document_processor': mock_document_processor,
+            **overrides
         }
+        monkeypatch.setattr('rag_system.VectorStore', Mock(return_value=components['vector_store']))
+        monkeypatch.setattr('rag_system.AIGenerator', Mock(return_value=components['ai_generator']))
+        monkeypatch.setattr('rag_system.DocumentProcessor', Mock(return_value=components['document_processor']))
+        monkeypatch.setattr('rag_system.SessionManager', Mock(return_value=components['session_manager']))
+        return RAGSystem(config or mock_config)
+
+    return make
+
+
+@pytest.fixture(scope='module')
+def patched_rag_deps():
+    """
+    Replace RAGSystem's component classes with Mocks for one test module.
+
+    Module scope keeps the patch from leaking into modules collected later
+    on the same worker, which may build a real RAGSystem.
+
+    Yields a namespace of the patched classes; each one's return_value is
+    the component instance a RAGSystem built meanwhile receives, a mock
+    spec_set to the real class.
+    """
+    deps = SimpleNamespace(
+        VectorStore=Mock(return_value=Mock(spec_set=VectorStore)),
+        AIGenerator=Mock(return_value=Mock(spec_set=AIGenerator)),
+        DocumentProcessor=Mock(return_value=Mock(spec_set=DocumentProcessor)),
+        SessionManager=Mock(return_value=Mock(spec_set=SessionManager))
+    )
+    with pytest.MonkeyPatch.context() as mp:
+        for name, mock_class in vars(deps).items():
+            mp.setattr(f'rag_system.{name}', mock_class)
+        yield deps
+
+
+@pytest.fixture(scope='module')
+def _rag_system_template(patched_rag_deps):
+    """A RAGSystem built once per test module on the patched components"""
+    return RAGSystem(MockConfig())
+
+
+@pytest.fixture
+def rag(
+    _rag_system_template,
+    mock_ai_generator,
+    mock_session_manager,
+    mock_document_processor
+):
+    """
+    Per-test shallow copy of the module's RAGSystem.
+
+    The per-test component mocks above are assigned straight onto the copy.
+    The vector store is bound into the search tools at construction, so the
+    shared one is reset instead (return values and side effects included).
+    """
+    _rag_system_template.vector_store.reset_mock(return_value=True, side_effect=True)
+    rag = copy.copy(_rag_system_template)
+    rag.ai_generator = mock_ai_generator
+    rag.session_manager = mock_session_manager
+    rag.document_processor = mock_document_processor
+    return rag
@@ -9,148 +9,324 @@ These tests verify:
 5. Error handling and termination conditions
 """
 
-import os
-import sys
-
+import asyncio
+import threading
+from collections.abc import Callable
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import NamedTuple
+from unittest.mock import AsyncMock, Mock, patch
+
+import ai_generator
 import pytest
+from ai_generator import AIGenerator
+from search_tools import ToolManager
 
-# Add parent directory to path for imports
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from unittest.mock import Mock, patch
+@pytest.fixture(scope="module", autouse=True)
+def anthropic_class():
+    """Patch the Anthropic client class once, checking calls against its signature"""
+    with patch.object(
+        ai_generator.anthropic, "AsyncAnthropic", autospec=True
+    ) as client_class:
+        client_class.return_value = AsyncMock()
+        yield client_class
+
+
+@pytest.fixture(autouse=True)
+def mock_client(anthropic_class):
+    """The mocked Anthropic client, reset so each test starts clean"""
+    anthropic_class.reset_mock()
+    client = anthropic_class.return_value
+    client.reset_mock(return_value=True, side_effect=True)
+    return client
 
-from ai_generator import AIGenerator
 
+@pytest.fixture
+def generator(request):
+    """An AIGenerator on the mocked client; parametrize indirectly to override"""
+    overrides = getattr(request, "param", {})
+    return AIGenerator(**{"api_key": "test-key", "model": "test-model", **overrides})
 
+
+@pytest.fixture
+def mock_tool_manager():
+    """A ToolManager stand-in that rejects attributes the real one lacks"""
+    return Mock(spec_set=ToolManager)
+
+
+@dataclass(slots=True, frozen=True)
 class MockTextBlock:
     """Mock for Anthropic TextBlock response"""
 
-    def __init__(self, text):
-        self.type = "text"
-        self.text = text
+    text: str
+    type: str = "text"
 
 
+@dataclass(slots=True, frozen=True)
 class MockToolUseBlock:
     """Mock for Anthropic ToolUseBlock response"""
 
-    def __init__(self, tool_id, name, input_data):
-        self.type = "tool_use"
-        self.id = tool_id
-        self.name = name
-        self.input = input_data
+    id: str
+    name: str
+    input: dict
+    type: str = "tool_use"
+
 
+class MockUsage(NamedTuple):
+    """Mock for Anthropic Usage token counts"""
 
-class MockResponse:
+    input_tokens: int = 10
+    output_tokens: int = 5
+
+
+class MockResponse(NamedTuple):
     """Mock for Anthropic API response"""
 
-    def __init__(self, content, stop_reason="end_turn"):
-        self.content = content
-        self.stop_reason = stop_reason
+    content: list
+    stop_reason: str = "end_turn"
+    usage: MockUsage = MockUsage()
+
+
+class MockStream:
+    """Mock for the Anthropic async message stream context manager"""
+
+    def __init__(self, chunks, final_message):
+        self.chunks = chunks
+        self.final_message = final_message
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield Mock(type="text", text=chunk)
+        for block in self.final_message.content:
+            if block.type == "tool_use":
+                yield Mock(type="content_block_stop", content_block=block)
+
+    async def get_final_message(self):
+        return self.final_message
+
+
+class ToolRoundScenario(NamedTuple):
+    """A scripted tool-use conversation and what it should produce"""
+
+    responses: tuple
+    tool_results: tuple
+    tools_sent: tuple
+    post_assert: Callable[[Mock], None] | None = None
+
+
+def assert_full_message_chain(client):
+    """Check the last call carries every round: user, then assistant/user pairs"""
+    messages = client.messages.create.call_args_list[-1].kwargs["messages"]
+    # user, assistant(tool1), user(result1), assistant(tool2), user(result2)
+    assert [m["role"] for m in messages] == [
+        "user",
+        "assistant",
+        "user",
+        "assistant",
+        "user",
+    ]
+
+
+# Generator settings with routing of SIMPLE queries to a cheaper model
+ROUTED_GENERATOR = {
+    "model": "claude-sonnet-4-20250514",
+    "simple_model": "claude-haiku-4-5-20251001",
+}
+
+# Canned blocks and responses shared across tests (blocks are frozen)
+ANSWER_BLOCK = MockTextBlock("Answer.")
+ANSWER = MockResponse(content=[ANSWER_BLOCK], stop_reason="end_turn")
+
+SEARCH_ROUND = MockResponse(
+    content=[MockToolUseBlock("tool_1", "search_course_content", {"query": "MCP"})],
+    stop_reason="tool_use",
+)
+SECOND_SEARCH_ROUND = MockResponse(
+    content=[MockToolUseBlock("tool_2", "search_course_content", {"query": "more"})],
+    stop_reason="tool_use",
+)
+OUTLINE_ROUND = MockResponse(
+    content=[MockToolUseBlock("tool_2", "get_course_outline", {"course_name": "MCP"})],
+    stop_reason="tool_use",
+)
+FINAL_ANSWER = MockResponse(
+    content=[MockTextBlock("MCP is covered in lessons 1-3 of the MCP course.")],
+    stop_reason="end_turn",
+)
 
 
 class TestAIGeneratorWithoutTools:
     """Test AIGenerator when not using tools"""
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_generate_response_returns_text(self, mock_anthropic_class):
+    async def test_generate_response_returns_text(self, mock_client, generator):
         """Test that a simple query returns text response"""
         # Arrange
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
         mock_response = MockResponse(
             content=[MockTextBlock("This is a response about course content.")],
             stop_reason="end_turn",
         )
         mock_client.messages.create.return_value = mock_response
 
-        generator = AIGenerator(api_key="test-key", model="claude-sonnet-4-20250514")
-
         # Act
-        result = generator.generate_response(query="What is machine learning?")
+        result = await generator.generate_response(query="What is machine learning?")
 
         # Assert
         assert result == "This is a response about course content."
         mock_client.messages.create.assert_called_once()
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_generate_response_includes_conversation_history(
-        self, mock_anthropic_class
+    async def test_generate_response_includes_conversation_history(
+        self, mock_client, generator
     ):
         """Test that conversation history is included in system prompt"""
         # Arrange
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
         mock_response = MockResponse(
             content=[MockTextBlock("Response with context.")], stop_reason="end_turn"
         )
         mock_client.messages.create.return_value = mock_response
 
-        generator = AIGenerator(api_key="test-key", model="claude-sonnet-4-20250514")
-
         # Act
-        result = generator.generate_response(
+        result = await generator.generate_response(
             query="Follow up question",
             conversation_history="User: Previous question\nAssistant: Previous answer",
         )
 
         # Assert
         call_args = mock_client.messages.create.call_args
-        system_content = call_args.kwargs.get("system", "")
-        assert "Previous conversation" in system_content
-        assert "Previous question" in system_content
+        system_blocks = call_args.kwargs["system"]
+        assert len(system_blocks) == 2
+        assert "Previous conversation" in system_blocks[1]["text"]
+        assert "Previous question" in system_blocks[1]["text"]
+        # Only the static prompt is cached; history changes every turn
+        assert system_blocks[0]["cache_control"] == {"type": "ephemeral"}
+        assert "cache_control" not in system_blocks[1]
+
+    def test_long_history_trimmed_at_message_boundary(self, generator):
+        """Test that only the latest whole exchanges of a long history are kept"""
+        generator.MAX_HISTORY_CHARS = 60
+        history = "\n".join(
+            f"User: Question {i}\nAssistant: Answer {i}" for i in range(5)
+        )
 
+        system_blocks = generator._build_system(history)
 
-class TestSingleRoundToolUse:
-    """Test AIGenerator with single round of tool use (regression tests)"""
+        kept = system_blocks[1]["text"].removeprefix("Previous conversation:\n")
+        assert kept.startswith("User: ")
+        assert kept.endswith("Assistant: Answer 4")
+        assert "Question 0" not in kept
+        assert len(kept) <= 60
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_single_tool_call_returns_answer(self, mock_anthropic_class):
-        """Test that single tool use works and returns answer"""
+    async def test_batch_generate_preserves_query_order(self, mock_client, generator):
+        """Test that batched queries return answers in input order"""
         # Arrange
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
 
-        tool_use_response = MockResponse(
-            content=[
-                MockToolUseBlock(
-                    "tool_123", "search_course_content", {"query": "tool use"}
-                )
-            ],
-            stop_reason="tool_use",
+        async def answer(**kwargs):
+            query = kwargs["messages"][0]["content"]
+            return MockResponse(content=[MockTextBlock(f"Answer to {query}")])
+
+        mock_client.messages.create.side_effect = answer
+
+        # Act
+        results = await generator.batch_generate(["Q1", "Q2", "Q3"])
+
+        # Assert
+        assert results == ["Answer to Q1", "Answer to Q2", "Answer to Q3"]
+        assert mock_client.messages.create.call_count == 3
+
+    async def test_large_batch_uses_batches_api(self, mock_client, generator):
+        """Test that large query sets go through the Message Batches API"""
+        # Arrange
+        queries = [f"Q{i}" for i in range(AIGenerator.BATCH_API_MIN_QUERIES)]
+
+        mock_client.messages.batches.create.return_value = Mock(
+            id="batch_1", processing_status="in_progress"
+        )
+        mock_client.messages.batches.retrieve.return_value = Mock(
+            id="batch_1", processing_status="ended"
         )
 
-        final_response = MockResponse(
-            content=[
-                MockTextBlock("Tool use allows Claude to call external functions.")
-            ],
-            stop_reason="end_turn",
+        async def results():
+            # Out of order, with one errored request
+            for i in reversed(range(1, len(queries))):
+                message = MockResponse(content=[MockTextBlock(f"Answer to Q{i}")])
+                yield Mock(
+                    custom_id=str(i),
+                    result=Mock(type="succeeded", message=message),
+                )
+            yield Mock(custom_id="0", result=Mock(type="errored"))
+
+        mock_client.messages.batches.results.return_value = results()
+        mock_client.messages.create.return_value = MockResponse(
+            content=[MockTextBlock("Answer to Q0")]
         )
 
-        mock_client.messages.create.side_effect = [tool_use_response, final_response]
+        generator.BATCH_POLL_INTERVAL = 0
+
+        # Act
+        answers = await generator.batch_generate(queries)
+
+        # Assert
+        assert answers == [f"Answer to {q}" for q in queries]
+        requests = mock_client.messages.batches.create.call_args.kwargs["requests"]
+        assert [r["custom_id"] for r in requests] == [
+            str(i) for i in range(len(queries))
+        ]
+        assert "tools" not in requests[0]["params"]
+        mock_client.messages.batches.retrieve.assert_called_once_with("batch_1")
+        # Only the errored request is retried interactively
+        mock_client.messages.create.assert_called_once()
+
+    @pytest.mark.parametrize(
+        "generator", [{"max_retries": 3, "max_concurrency": 2}], indirect=True
+    )
+    async def test_concurrent_calls_capped(
+        self, mock_client, anthropic_class, generator
+    ):
+        """Test that API calls in flight never exceed max_concurrency"""
+        # Arrange
+        in_flight = 0
+        peak = 0
 
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "[Course] Content about tools"
+        async def answer(**kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return ANSWER
 
-        generator = AIGenerator(api_key="test-key", model="test-model")
+        mock_client.messages.create.side_effect = answer
 
         # Act
-        result = generator.generate_response(
-            query="What is tool use?",
-            tools=[{"name": "search_course_content"}],
-            tool_manager=mock_tool_manager,
-        )
+        await generator.batch_generate([f"Q{i}" for i in range(6)])
 
         # Assert
-        assert mock_client.messages.create.call_count == 2
-        assert mock_tool_manager.execute_tool.call_count == 1
-        assert "Tool use allows Claude" in result
+        assert peak == 2
+        assert anthropic_class.call_args.kwargs["max_retries"] == 3
+
+    def test_generators_share_http_client(self, anthropic_class):
+        """Test that every generator reuses one pooled HTTP client"""
+        AIGenerator(api_key="test-key", model="test-model")
+        AIGenerator(api_key="test-key", model="test-model")
+
+        first, second = anthropic_class.call_args_list
+        assert first.kwargs["http_client"] is second.kwargs["http_client"]
+
+
+class TestSingleRoundToolUse:
+    """Test AIGenerator with single round of tool use (regression tests)"""
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_no_tool_use_returns_direct_answer(self, mock_anthropic_class):
+    async def test_no_tool_use_returns_direct_answer(
+        self, mock_client, generator, mock_tool_manager
+    ):
         """Test that queries not needing tools return directly"""
         # Arrange
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
 
         mock_response = MockResponse(
             content=[MockTextBlock("Direct answer without tools.")],
@@ -158,46 +334,33 @@ class TestSingleRoundToolUse:
         )
         mock_client.messages.create.return_value = mock_response
 
-        generator = AIGenerator(api_key="test-key", model="test-model")
-
         # Act
-        result = generator.generate_response(
+        result = await generator.generate_response(
             query="What is 2+2?",
             tools=[{"name": "search_course_content"}],
-            tool_manager=Mock(),
+            tool_manager=mock_tool_manager,
         )
 
         # Assert
         assert mock_client.messages.create.call_count == 1
         assert result == "Direct answer without tools."
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_tool_result_passed_to_claude(self, mock_anthropic_class):
+    async def test_tool_result_passed_to_claude(
+        self, mock_client, generator, mock_tool_manager
+    ):
         """Test that tool results are correctly formatted and sent back"""
         # Arrange
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
-
-        tool_use_response = MockResponse(
-            content=[
-                MockToolUseBlock("tool_456", "search_course_content", {"query": "MCP"})
-            ],
-            stop_reason="tool_use",
-        )
 
         final_response = MockResponse(
             content=[MockTextBlock("MCP is a protocol...")], stop_reason="end_turn"
         )
 
-        mock_client.messages.create.side_effect = [tool_use_response, final_response]
+        mock_client.messages.create.side_effect = [SEARCH_ROUND, final_response]
 
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Search result about MCP"
-
-        generator = AIGenerator(api_key="test-key", model="test-model")
+        mock_tool_manager.execute_tool.return_value = ("Search result about MCP", [])
 
         # Act
-        generator.generate_response(
+        await generator.generate_response(
             query="What is MCP?",
             tools=[{"name": "search_course_content"}],
             tool_manager=mock_tool_manager,
@@ -212,244 +375,331 @@ class TestSingleRoundToolUse:
 
         tool_result_content = messages[2]["content"]
         assert tool_result_content[0]["type"] == "tool_result"
-        assert tool_result_content[0]["tool_use_id"] == "tool_456"
+        assert tool_result_content[0]["tool_use_id"] == "tool_1"
         assert tool_result_content[0]["content"] == "Search result about MCP"
 
+    async def test_registered_tools_used_by_default(self, mock_client, generator):
+        """Test that tools from set_tools are offered when none are passed"""
+        # Arrange
+        mock_client.messages.create.return_value = ANSWER
 
-class TestMultiRoundToolUse:
-    """Test sequential tool calling (up to 2 rounds)"""
+        tools = [{"name": "search_course_content"}, {"name": "get_course_outline"}]
+        generator.set_tools(tools)
+
+        # Act
+        await generator.generate_response(query="What is MCP?")
+        await generator.generate_response(query="What is RAG?", tools=[])
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_two_round_tool_use_completes(self, mock_anthropic_class):
-        """Test that Claude can use tools in 2 sequential rounds"""
+        # Assert
+        first, second = mock_client.messages.create.call_args_list
+        assert first.kwargs["tools"] is generator._tools
+        assert first.kwargs["tools"][-1]["cache_control"] == {"type": "ephemeral"}
+        assert "cache_control" not in tools[-1]
+        assert "tools" not in second.kwargs
+
+    async def test_set_tools_with_empty_list_clears_tools(self, mock_client, generator):
+        """Test that registering no tools offers none instead of failing"""
         # Arrange
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
+        mock_client.messages.create.return_value = ANSWER
+        generator.set_tools([{"name": "search_course_content"}])
 
-        # Round 1: Claude searches for content
-        round1_response = MockResponse(
-            content=[
-                MockToolUseBlock(
-                    "tool_1", "search_course_content", {"query": "MCP basics"}
-                )
-            ],
-            stop_reason="tool_use",
-        )
+        # Act
+        generator.set_tools([])
+        await generator.generate_response(query="What is MCP?")
 
-        # Round 2: Claude gets course outline for more context
-        round2_response = MockResponse(
+        # Assert
+        call_kwargs = mock_client.messages.create.call_args.kwargs
+        assert "tools" not in call_kwargs
+        assert call_kwargs["messages"][0]["content"] == "What is MCP?"
+
+    async def test_parallel_tool_calls_run_concurrently(
+        self, mock_client, generator, mock_tool_manager
+    ):
+        """Test that tool_use blocks in one turn run together, results in order"""
+        # Arrange
+
+        tool_use_response = MockResponse(
             content=[
-                MockToolUseBlock("tool_2", "get_course_outline", {"course_name": "MCP"})
+                MockToolUseBlock("tool_1", "search_course_content", {"query": "a"}),
+                MockToolUseBlock("tool_2", "search_course_content", {"query": "b"}),
             ],
             stop_reason="tool_use",
         )
-
-        # Final: Claude provides answer
         final_response = MockResponse(
-            content=[MockTextBlock("MCP is covered in lessons 1-3 of the MCP course.")],
-            stop_reason="end_turn",
+            content=[MockTextBlock("Combined answer.")], stop_reason="end_turn"
         )
+        mock_client.messages.create.side_effect = [tool_use_response, final_response]
 
-        mock_client.messages.create.side_effect = [
-            round1_response,
-            round2_response,
-            final_response,
-        ]
+        # Both calls must be in flight at once to pass the barrier
+        barrier = threading.Barrier(2, timeout=5)
 
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = [
-            "Content about MCP basics...",
-            "Course: MCP\nLesson 1: Intro\nLesson 2: Architecture",
-        ]
+        thread_names = []
 
-        generator = AIGenerator(api_key="test-key", model="test-model")
+        def execute_tool(name, query):
+            thread_names.append(threading.current_thread().name)
+            barrier.wait()
+            return f"Result {query}", [{"text": f"Course {query}", "url": None}]
+
+        mock_tool_manager.execute_tool.side_effect = execute_tool
 
         # Act
-        result = generator.generate_response(
-            query="What is MCP and where is it covered?",
-            tools=[{"name": "search_course_content"}, {"name": "get_course_outline"}],
+        sources = []
+        result = await generator.generate_response(
+            query="Compare a and b",
+            tools=[{"name": "search_course_content"}],
             tool_manager=mock_tool_manager,
+            sources=sources,
         )
 
         # Assert
-        assert mock_client.messages.create.call_count == 3
-        assert mock_tool_manager.execute_tool.call_count == 2
-        assert "MCP is covered" in result
+        assert result == "Combined answer."
+        assert [s["text"] for s in sources] == ["Course a", "Course b"]
+        messages = mock_client.messages.create.call_args_list[1].kwargs["messages"]
+        tool_results = messages[2]["content"]
+        assert [r["tool_use_id"] for r in tool_results] == ["tool_1", "tool_2"]
+        assert [r["content"] for r in tool_results] == ["Result a", "Result b"]
+        # Tools run on the generator's own pool, off the event loop
+        assert all(name.startswith("tool") for name in thread_names)
+
+    async def test_concurrent_requests_collect_their_own_sources(
+        self, mock_client, generator, mock_tool_manager
+    ):
+        """Test that overlapping requests never see each other's tool sources"""
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_max_rounds_enforced(self, mock_anthropic_class):
-        """Test that third tool_use is not honored (max 2 rounds)"""
         # Arrange
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
+        def create(messages, **kwargs):
+            # The prompt wraps the query; its last word names the topic
+            query = messages[0]["content"].split()[-1]
+            if len(messages) == 1:
+                return MockResponse(
+                    content=[
+                        MockToolUseBlock(
+                            "tool_1", "search_course_content", {"query": query}
+                        )
+                    ],
+                    stop_reason="tool_use",
+                )
+            return MockResponse([MockTextBlock(f"About {query}")], "end_turn")
 
-        # Round 1: tool use
-        round1_response = MockResponse(
-            content=[
-                MockToolUseBlock("tool_1", "search_course_content", {"query": "first"})
-            ],
-            stop_reason="tool_use",
-        )
+        mock_client.messages.create.side_effect = create
 
-        # Round 2: tool use
-        round2_response = MockResponse(
-            content=[
-                MockToolUseBlock("tool_2", "search_course_content", {"query": "second"})
-            ],
-            stop_reason="tool_use",
-        )
+        # Both searches must be in flight at once to pass the barrier
+        barrier = threading.Barrier(2, timeout=5)
 
-        # Round 3: Would want tool use, but should be forced to give text
-        # (tools not included in API call, so Claude gives text)
-        round3_response = MockResponse(
-            content=[MockTextBlock("Final answer after max rounds.")],
-            stop_reason="end_turn",
+        def execute_tool(name, query):
+            barrier.wait()
+            return f"Result {query}", [{"text": query, "url": None}]
+
+        mock_tool_manager.execute_tool.side_effect = execute_tool
+
+        # Act
+        sources_a, sources_b = [], []
+        answers = await asyncio.gather(
+            *(
+                generator.generate_response(
+                    query=query,
+                    tools=[{"name": "search_course_content"}],
+                    tool_manager=mock_tool_manager,
+                    sources=sources,
+                )
+                for query, sources in [("MCP", sources_a), ("RAG", sources_b)]
+            )
         )
 
-        mock_client.messages.create.side_effect = [
-            round1_response,
-            round2_response,
-            round3_response,
-        ]
+        # Assert
+        assert answers == ["About MCP", "About RAG"]
+        assert sources_a == [{"text": "MCP", "url": None}]
+        assert sources_b == [{"text": "RAG", "url": None}]
+
 
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = ["Result 1", "Result 2"]
+class TestMultiRoundToolUse:
+    """Test sequential tool calling (up to 2 rounds)"""
+
+    @pytest.mark.parametrize(
+        "scenario",
+        [
+            pytest.param(
+                ToolRoundScenario(
+                    responses=(SEARCH_ROUND, FINAL_ANSWER),
+                    tool_results=("[Course] Content about tools",),
+                    tools_sent=(True, True),
+                ),
+                id="single_round",
+            ),
+            pytest.param(
+                ToolRoundScenario(
+                    responses=(SEARCH_ROUND, OUTLINE_ROUND, FINAL_ANSWER),
+                    tool_results=("Content about MCP basics...", "Course: MCP"),
+                    tools_sent=(True, True, False),
+                    post_assert=assert_full_message_chain,
+                ),
+                id="two_rounds",
+            ),
+            pytest.param(
+                ToolRoundScenario(
+                    responses=(SEARCH_ROUND, SECOND_SEARCH_ROUND, FINAL_ANSWER),
+                    tool_results=("Result 1", "Result 2"),
+                    tools_sent=(True, True, False),
+                ),
+                id="max_rounds_enforced",
+            ),
+        ],
+    )
+    async def test_tool_rounds(
+        self, mock_client, scenario, generator, mock_tool_manager
+    ):
+        """Test that each tool round runs its tools and the last call has none"""
+        # Arrange
+        mock_client.messages.create.side_effect = iter(scenario.responses)
 
-        generator = AIGenerator(api_key="test-key", model="test-model")
+        mock_tool_manager.execute_tool.side_effect = iter(
+            (text, []) for text in scenario.tool_results
+        )
 
+        test_tools = [{"name": "search_course_content"}, {"name": "get_course_outline"}]
         # Act
-        result = generator.generate_response(
-            query="Complex multi-step query",
-            tools=[{"name": "search_course_content"}],
+        result = await generator.generate_response(
+            query="What is MCP and where is it covered?",
+            tools=test_tools,
             tool_manager=mock_tool_manager,
         )
 
         # Assert
-        assert mock_client.messages.create.call_count == 3
-        assert mock_tool_manager.execute_tool.call_count == 2  # Only 2 tool executions
-        assert "Final answer" in result
+        calls = mock_client.messages.create.call_args_list
+        assert len(calls) == len(scenario.responses)
+        assert mock_tool_manager.execute_tool.call_count == len(scenario.tool_results)
+        assert result == FINAL_ANSWER.content[0].text
+
+        # Tools are offered on every round except the one forced to answer
+        assert tuple("tools" in call.kwargs for call in calls) == scenario.tools_sent
+        for call in calls:
+            sent_tools = call.kwargs.get("tools")
+            if sent_tools:
+                assert [t["name"] for t in sent_tools] == [
+                    t["name"] for t in test_tools
+                ]
+                assert sent_tools[-1]["cache_control"] == {"type": "ephemeral"}
+
+        # The caller's tool definitions are not mutated
+        assert "cache_control" not in test_tools[-1]
 
-        # Verify third API call does NOT include tools
-        third_call_args = mock_client.messages.create.call_args_list[2]
-        assert "tools" not in third_call_args.kwargs
+        if scenario.post_assert:
+            scenario.post_assert(mock_client)
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_early_termination_on_end_turn(self, mock_anthropic_class):
-        """Test that loop stops when Claude returns end_turn after first round"""
+
+class TestOutlineSearchPipelining:
+    """Test running the lesson search in the same round as the outline"""
+
+    async def test_outline_then_lesson_search_in_one_round(
+        self, mock_client, generator, mock_tool_manager
+    ):
+        """Test that a lesson question skips the second tool round"""
         # Arrange
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
 
-        # Round 1: tool use
-        round1_response = MockResponse(
+        outline_response = MockResponse(
             content=[
-                MockToolUseBlock("tool_1", "search_course_content", {"query": "test"})
+                MockToolUseBlock("tool_1", "get_course_outline", {"course_name": "MCP"})
             ],
             stop_reason="tool_use",
         )
-
-        # Claude satisfied after first tool, returns text
         final_response = MockResponse(
-            content=[MockTextBlock("Got enough info from first search.")],
+            content=[MockTextBlock("Lesson 2 covers architecture.")],
             stop_reason="end_turn",
         )
+        mock_client.messages.create.side_effect = [outline_response, final_response]
 
-        mock_client.messages.create.side_effect = [round1_response, final_response]
-
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Sufficient result"
-
-        generator = AIGenerator(api_key="test-key", model="test-model")
+        mock_tool_manager.execute_tool.side_effect = [
+            (
+                "Course: MCP Servers\nCourse Link: https://example.com\n\nLessons:",
+                [{"text": "MCP Servers", "url": "https://example.com"}],
+            ),
+            (
+                "[MCP Servers - Lesson 2]\nArchitecture details",
+                [{"text": "MCP Servers - Lesson 2", "url": None}],
+            ),
+        ]
 
         # Act
-        result = generator.generate_response(
-            query="Simple query",
-            tools=[{"name": "search_course_content"}],
+        sources = []
+        result = await generator.generate_response(
+            query="What does lesson 2 of MCP cover?",
+            tools=[{"name": "search_course_content"}, {"name": "get_course_outline"}],
             tool_manager=mock_tool_manager,
+            sources=sources,
         )
 
         # Assert
-        assert mock_client.messages.create.call_count == 2  # Not 3
-        assert mock_tool_manager.execute_tool.call_count == 1
-        assert "Got enough info" in result
+        assert result == "Lesson 2 covers architecture."
+        # Both the outline and the prefetched search are cited
+        assert [s["text"] for s in sources] == ["MCP Servers", "MCP Servers - Lesson 2"]
+        mock_tool_manager.execute_tool.assert_called_with(
+            "search_course_content",
+            query="What does lesson 2 of MCP cover?",
+            course_name="MCP Servers",
+            lesson_number=2,
+        )
+
+        # The prefetched search rides along with the outline result, and the
+        # next call is the final one
+        second_call = mock_client.messages.create.call_args_list[1]
+        assert "tools" not in second_call.kwargs
+        user_content = second_call.kwargs["messages"][2]["content"]
+        assert user_content[0]["tool_use_id"] == "tool_1"
+        assert user_content[1]["type"] == "text"
+        assert "Architecture details" in user_content[1]["text"]
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_tools_included_in_both_rounds(self, mock_anthropic_class):
-        """Test that tools are available in both round 1 and round 2"""
+    async def test_outline_without_lesson_keeps_tool_round(
+        self, mock_client, generator, mock_tool_manager
+    ):
+        """Test that outline questions without a lesson are not pipelined"""
         # Arrange
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
 
-        round1_response = MockResponse(
-            content=[MockToolUseBlock("t1", "search_course_content", {"query": "a"})],
-            stop_reason="tool_use",
-        )
-        round2_response = MockResponse(
+        outline_response = MockResponse(
             content=[
-                MockToolUseBlock("t2", "get_course_outline", {"course_name": "X"})
+                MockToolUseBlock("tool_1", "get_course_outline", {"course_name": "MCP"})
             ],
             stop_reason="tool_use",
         )
         final_response = MockResponse(
-            content=[MockTextBlock("Done")], stop_reason="end_turn"
+            content=[MockTextBlock("Here is the outline.")], stop_reason="end_turn"
         )
+        mock_client.messages.create.side_effect = [outline_response, final_response]
 
-        mock_client.messages.create.side_effect = [
-            round1_response,
-            round2_response,
-            final_response,
-        ]
-
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = ["R1", "R2"]
-
-        test_tools = [{"name": "search_course_content"}, {"name": "get_course_outline"}]
-        generator = AIGenerator(api_key="test-key", model="test-model")
+        mock_tool_manager.execute_tool.return_value = ("Course: MCP Servers", [])
 
         # Act
-        generator.generate_response(
-            query="Test", tools=test_tools, tool_manager=mock_tool_manager
+        await generator.generate_response(
+            query="What is the outline of the MCP course?",
+            tools=[{"name": "search_course_content"}, {"name": "get_course_outline"}],
+            tool_manager=mock_tool_manager,
         )
 
-        # Assert - tools in first two calls
-        first_call = mock_client.messages.create.call_args_list[0]
+        # Assert
+        assert mock_tool_manager.execute_tool.call_count == 1
         second_call = mock_client.messages.create.call_args_list[1]
-
-        assert first_call.kwargs.get("tools") == test_tools
-        assert second_call.kwargs.get("tools") == test_tools
+        assert "tools" in second_call.kwargs
 
 
 class TestToolErrorHandling:
     """Test error handling during tool execution"""
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_tool_error_prevents_further_rounds(self, mock_anthropic_class):
+    async def test_tool_error_prevents_further_rounds(
+        self, mock_client, generator, mock_tool_manager
+    ):
         """Test that tool execution error stops further tool use"""
         # Arrange
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
-
-        tool_use_response = MockResponse(
-            content=[
-                MockToolUseBlock("tool_1", "search_course_content", {"query": "test"})
-            ],
-            stop_reason="tool_use",
-        )
 
         final_response = MockResponse(
             content=[MockTextBlock("Handled the error gracefully.")],
             stop_reason="end_turn",
         )
 
-        mock_client.messages.create.side_effect = [tool_use_response, final_response]
+        mock_client.messages.create.side_effect = [SEARCH_ROUND, final_response]
 
-        mock_tool_manager = Mock()
         mock_tool_manager.execute_tool.side_effect = Exception("Tool failed!")
 
-        generator = AIGenerator(api_key="test-key", model="test-model")
-
         # Act
-        result = generator.generate_response(
+        result = await generator.generate_response(
             query="Test",
             tools=[{"name": "search_course_content"}],
             tool_manager=mock_tool_manager,
@@ -468,28 +718,20 @@ class TestToolErrorHandling:
         assert tool_result["is_error"] is True
         assert "Error executing tool" in tool_result["content"]
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_api_error_propagates(self, mock_anthropic_class):
+    async def test_api_error_propagates(self, mock_client, generator):
         """Test that API errors are not caught"""
         # Arrange
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
         mock_client.messages.create.side_effect = Exception("API Error: Rate limited")
 
-        generator = AIGenerator(api_key="test-key", model="test-model")
-
         # Act & Assert
         with pytest.raises(Exception) as exc_info:
-            generator.generate_response(query="Test query")
+            await generator.generate_response(query="Test query")
 
         assert "API Error" in str(exc_info.value)
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_without_tool_manager_returns_text(self, mock_anthropic_class):
+    async def test_without_tool_manager_returns_text(self, mock_client, generator):
         """Test that tool_use without tool_manager returns available text"""
         # Arrange
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
 
         response = MockResponse(
             content=[
@@ -501,10 +743,8 @@ class TestToolErrorHandling:
 
         mock_client.messages.create.return_value = response
 
-        generator = AIGenerator(api_key="test-key", model="test-model")
-
         # Act - no tool_manager
-        result = generator.generate_response(
+        result = await generator.generate_response(
             query="Search", tools=[{"name": "search"}], tool_manager=None
         )
 
@@ -512,54 +752,364 @@ class TestToolErrorHandling:
         assert result == "I would search but can't."
 
 
-class TestMessageChainConstruction:
-    """Test that message history is correctly built across rounds"""
+@pytest.mark.parametrize("generator", [ROUTED_GENERATOR], indirect=True)
+class TestModelRouting:
+    """Test routing of SIMPLE queries to the cheaper model"""
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_messages_accumulate_correctly(self, mock_anthropic_class):
-        """Test that all messages are preserved across rounds"""
+    async def test_simple_query_uses_simple_model_without_tools(
+        self, mock_client, generator, mock_tool_manager
+    ):
+        """Test that a greeting goes to the simple model with no tools"""
         # Arrange
-        mock_client = Mock()
-        mock_anthropic_class.return_value = mock_client
+        mock_client.messages.create.return_value = MockResponse(
+            content=[MockTextBlock("Hello!")], stop_reason="end_turn"
+        )
 
-        round1_response = MockResponse(
-            content=[MockToolUseBlock("t1", "search", {"query": "a"})],
-            stop_reason="tool_use",
+        tools = [{"name": "search_course_content", "description": "Search"}]
+
+        # Act
+        result = await generator.generate_response(
+            query="Hi there", tools=tools, tool_manager=mock_tool_manager
         )
-        round2_response = MockResponse(
-            content=[MockToolUseBlock("t2", "outline", {"course": "b"})],
-            stop_reason="tool_use",
+
+        # Assert
+        assert result == "Hello!"
+        call_kwargs = mock_client.messages.create.call_args.kwargs
+        assert call_kwargs["model"] == "claude-haiku-4-5-20251001"
+        assert call_kwargs["system"] == ai_generator._SYSTEM_PROMPT_SIMPLE
+        assert call_kwargs["messages"][0]["content"] == "Hi there"
+        assert "tools" not in call_kwargs
+
+    async def test_course_question_uses_configured_model(
+        self, mock_client, generator, mock_tool_manager
+    ):
+        """Test that questions keep the main model, tools and course framing"""
+        # Arrange
+        mock_client.messages.create.return_value = ANSWER
+
+        tools = [{"name": "search_course_content", "description": "Search"}]
+
+        # Act
+        await generator.generate_response(
+            query="What is RAG?", tools=tools, tool_manager=mock_tool_manager
         )
-        final_response = MockResponse(
-            content=[MockTextBlock("Final")], stop_reason="end_turn"
+
+        # Assert
+        call_kwargs = mock_client.messages.create.call_args.kwargs
+        assert call_kwargs["model"] == "claude-sonnet-4-20250514"
+        assert call_kwargs["messages"][0]["content"] == (
+            "Answer this question about course materials: What is RAG?"
+        )
+        assert call_kwargs["tools"][0]["name"] == "search_course_content"
+
+    def test_classify(self, generator):
+        """Test the SIMPLE/COMPLEX heuristics"""
+
+        assert generator._classify("Thanks, that helps") == "SIMPLE"
+        assert generator._classify("Hi, how are you?") == "SIMPLE"
+        assert generator._classify("What is MCP?") == "COMPLEX"
+        # Short requests without a question mark still need the tools
+        assert generator._classify("Explain MCP") == "COMPLEX"
+        assert generator._classify("Tell me about Chroma") == "COMPLEX"
+        assert generator._classify("Summarize MCP basics") == "COMPLEX"
+        # Small talk must be the whole query, not just its opening
+        assert generator._classify("Hi, what is MCP?") == "COMPLEX"
+        assert generator._classify("ok what is RAG?") == "COMPLEX"
+        assert generator._classify("No idea what MCP is?") == "COMPLEX"
+        assert generator._classify("Hi there!") == "SIMPLE"
+        assert generator._classify("Show the course outline") == "COMPLEX"
+        assert generator._classify("Thanks", "User: Hi\nAssistant: Hi") == "COMPLEX"
+        assert generator._classify("x" * 40) == "COMPLEX"
+
+        # Routing is off without a simple model
+        unrouted = AIGenerator(api_key="test-key", model="claude-sonnet-4-20250514")
+        assert unrouted._classify("Thanks") == "COMPLEX"
+
+
+class TestResponseCache:
+    """Test the in-process cache of completed responses"""
+
+    async def test_repeated_query_served_from_cache(self, mock_client, generator):
+        """Test that an identical history-free query skips the API call"""
+        # Arrange
+        mock_client.messages.create.return_value = MockResponse(
+            content=[MockTextBlock("Cached answer.")], stop_reason="end_turn"
         )
 
+        # Act
+        first = await generator.generate_response(query="What is MCP?")
+        second = await generator.generate_response(query="What is MCP?")
+
+        # Assert
+        assert first == second == "Cached answer."
+        mock_client.messages.create.assert_called_once()
+
+    async def test_concurrent_duplicates_share_one_call(self, mock_client, generator):
+        """Test that identical in-flight requests wait on a single API call"""
+        # Arrange
+        release = asyncio.Event()
+
+        async def answer(**kwargs):
+            await release.wait()
+            return MockResponse(content=[MockTextBlock("Shared answer.")])
+
+        mock_client.messages.create.side_effect = answer
+        # Act
+        requests = [
+            asyncio.create_task(generator.generate_response(query="What is MCP?"))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        answers = await asyncio.gather(*requests)
+
+        # Assert
+        assert answers == ["Shared answer."] * 3
+        mock_client.messages.create.assert_called_once()
+        assert generator._inflight == {}
+
+    async def test_history_and_tool_answers_not_cached(
+        self, mock_client, generator, mock_tool_manager
+    ):
+        """Test that answers depending on history or tool runs are not cached"""
+        # Arrange
         mock_client.messages.create.side_effect = [
-            round1_response,
-            round2_response,
-            final_response,
+            ANSWER,
+            ANSWER,
+            SEARCH_ROUND,
+            ANSWER,
+            SEARCH_ROUND,
+            ANSWER,
         ]
 
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = ["Result 1", "Result 2"]
+        mock_tool_manager.execute_tool.return_value = ("Result", [])
+        # Act
+        for _ in range(2):
+            await generator.generate_response(
+                query="Follow up", conversation_history="User: Hi\nAssistant: Hi"
+            )
+        for _ in range(2):
+            await generator.generate_response(
+                query="Search x",
+                tools=[{"name": "search_course_content"}],
+                tool_manager=mock_tool_manager,
+            )
 
-        generator = AIGenerator(api_key="test-key", model="test-model")
+        # Assert
+        assert mock_client.messages.create.call_count == 6
+
+    async def test_cache_evicts_least_recently_used(self, mock_client, generator):
+        """Test that the cache is bounded by RESPONSE_CACHE_SIZE"""
+        # Arrange
+        mock_client.messages.create.return_value = ANSWER
+
+        generator.RESPONSE_CACHE_SIZE = 2
 
         # Act
-        generator.generate_response(
-            query="Complex query",
-            tools=[{"name": "search"}, {"name": "outline"}],
-            tool_manager=mock_tool_manager,
+        await generator.generate_response(query="a")
+        await generator.generate_response(query="b")
+        await generator.generate_response(query="a")  # hit, refreshes "a"
+        await generator.generate_response(query="c")  # evicts "b"
+        await generator.generate_response(query="a")  # still cached
+        await generator.generate_response(query="b")  # miss
+
+        # Assert
+        assert mock_client.messages.create.call_count == 4
+
+
+class TestTurnMetrics:
+    """Test the per-response latency and usage log line"""
+
+    async def test_metrics_logged_for_tool_round(
+        self, mock_client, caplog, generator, mock_tool_manager
+    ):
+        """Test that tool rounds and token usage across calls are recorded"""
+        # Arrange
+        mock_client.messages.create.side_effect = [
+            MockResponse(
+                content=[
+                    MockToolUseBlock("tool_1", "search_course_content", {"query": "x"})
+                ],
+                stop_reason="tool_use",
+                usage=MockUsage(input_tokens=100, output_tokens=20),
+            ),
+            MockResponse(
+                content=[ANSWER_BLOCK],
+                usage=MockUsage(input_tokens=150, output_tokens=30),
+            ),
+        ]
+        mock_tool_manager.execute_tool.return_value = ("Result", [])
+
+        # Act
+        with caplog.at_level("INFO", logger="ai_generator"):
+            await generator.generate_response(
+                query="Search x",
+                tools=[{"name": "search_course_content"}],
+                tool_manager=mock_tool_manager,
+            )
+
+        # Assert
+        (record,) = [r for r in caplog.records if r.msg.startswith("llm_turn")]
+        assert record.model == "test-model"
+        assert record.tool_rounds == 1
+        assert record.input_tokens == 250
+        assert record.output_tokens == 50
+        assert record.total_ms >= record.api_ms + record.tool_exec_ms
+
+
+class TestStreamingResponse:
+    """Test streaming generation via messages.stream"""
+
+    async def test_stream_yields_text_chunks(self, mock_client, generator):
+        """Test that text deltas are yielded as they arrive"""
+        # Arrange
+        mock_client.messages.stream = Mock(
+            return_value=MockStream(
+                ["Hello", ", world"], MockResponse([MockTextBlock("Hello, world")])
+            )
         )
 
-        # Assert - check third call has full history
-        third_call = mock_client.messages.create.call_args_list[2]
-        messages = third_call.kwargs["messages"]
+        # Act
+        chunks = [c async for c in generator.generate_response_stream(query="Hi")]
 
-        # Should be: user, assistant(tool1), user(result1), assistant(tool2), user(result2)
-        assert len(messages) == 5
-        assert messages[0]["role"] == "user"
-        assert messages[1]["role"] == "assistant"
-        assert messages[2]["role"] == "user"
-        assert messages[3]["role"] == "assistant"
-        assert messages[4]["role"] == "user"
+        # Assert
+        assert chunks == ["Hello", ", world"]
+        mock_client.messages.stream.assert_called_once()
+
+    async def test_stream_executes_tools_before_next_round(
+        self, mock_client, generator, mock_tool_manager
+    ):
+        """Test that a tool_use round runs tools, then streams the answer"""
+        # Arrange
+
+        tool_round = MockStream(
+            ["Let me search."],
+            SEARCH_ROUND,
+        )
+        answer_round = MockStream(
+            ["MCP is ", "a protocol."],
+            MockResponse([MockTextBlock("MCP is a protocol.")]),
+        )
+        mock_client.messages.stream = Mock(side_effect=[tool_round, answer_round])
+
+        mock_tool_manager.execute_tool.return_value = ("Search result about MCP", [])
+
+        # Act
+        chunks = [
+            c
+            async for c in generator.generate_response_stream(
+                query="What is MCP?",
+                tools=[{"name": "search_course_content"}],
+                tool_manager=mock_tool_manager,
+            )
+        ]
+
+        # Assert
+        # The text before the tool call is marked for discarding
+        assert chunks == ["Let me search.", None, "MCP is ", "a protocol."]
+        mock_tool_manager.execute_tool.assert_called_once_with(
+            "search_course_content", query="MCP"
+        )
+        second_call = mock_client.messages.stream.call_args_list[1]
+        tool_result = second_call.kwargs["messages"][2]["content"][0]
+        assert tool_result["tool_use_id"] == "tool_1"
+        assert tool_result["content"] == "Search result about MCP"
+
+    async def test_stream_starts_tool_before_message_ends(
+        self, mock_client, generator, mock_tool_manager
+    ):
+        """Test that a tool runs as soon as its block completes mid-stream"""
+        # Arrange
+        tool_started = threading.Event()
+
+        class SlowTailStream(MockStream):
+            """Keeps generating for a while after the tool_use block"""
+
+            async def __aiter__(self):
+                async for event in super().__aiter__():
+                    yield event
+                for _ in range(100):
+                    if tool_started.is_set():
+                        break
+                    await asyncio.sleep(0.01)
+                self.tool_started_before_end = tool_started.is_set()
+
+        tool_round = SlowTailStream(
+            [],
+            SEARCH_ROUND,
+        )
+        answer_round = MockStream(["Done."], MockResponse([MockTextBlock("Done.")]))
+        mock_client.messages.stream = Mock(side_effect=[tool_round, answer_round])
+
+        def execute_tool(name, **kwargs):
+            tool_started.set()
+            return "Search result", []
+
+        mock_tool_manager.execute_tool.side_effect = execute_tool
+
+        # Act
+        chunks = [
+            c
+            async for c in generator.generate_response_stream(
+                query="What is MCP?",
+                tools=[{"name": "search_course_content"}],
+                tool_manager=mock_tool_manager,
+            )
+        ]
+
+        # Assert
+        assert chunks == ["Done."]
+        assert tool_round.tool_started_before_end
+        # The early result is reused, not executed a second time
+        mock_tool_manager.execute_tool.assert_called_once()
+
+    @pytest.mark.parametrize("stream_fails", [False, True], ids=["max_tokens", "error"])
+    async def test_stream_cancels_uncollected_early_tools(
+        self, mock_client, generator, mock_tool_manager, stream_fails
+    ):
+        """Test that early tools are cancelled when their round is not run"""
+        # Arrange
+        cancelled = asyncio.Event()
+
+        async def run_tool(tool_manager, name, **kwargs):
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        generator._run_tool = run_tool
+
+        class TruncatedStream(MockStream):
+            """Ends after a tool_use block, letting the early tool start"""
+
+            async def __aiter__(self):
+                async for event in super().__aiter__():
+                    yield event
+                await asyncio.sleep(0)
+                if stream_fails:
+                    raise ConnectionError("stream dropped")
+
+        mock_client.messages.stream = Mock(
+            return_value=TruncatedStream(
+                ["Partial"], SEARCH_ROUND._replace(stop_reason="max_tokens")
+            )
+        )
+
+        # Act
+        sources = []
+        chunks = []
+        with pytest.raises(ConnectionError) if stream_fails else nullcontext():
+            async for chunk in generator.generate_response_stream(
+                query="What is MCP?",
+                tools=[{"name": "search_course_content"}],
+                tool_manager=mock_tool_manager,
+                sources=sources,
+            ):
+                chunks.append(chunk)
+
+        # Assert
+        assert chunks == ["Partial"]
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        assert sources == []
+        mock_client.messages.stream.assert_called_once()
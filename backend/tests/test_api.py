@@ -10,17 +10,15 @@ These tests verify:
 Note: We define a test-specific FastAPI app here to avoid import issues
 with static file mounting that requires the frontend directory.
 """
+import httpx
 import pytest
-import sys
-import os
-from unittest.mock import Mock, patch
-from fastapi import FastAPI, HTTPException
-from fastapi.testclient import TestClient
+import pytest_asyncio
+import json
+from unittest.mock import AsyncMock, Mock, patch
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
-
-# Add parent directory to path for imports
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from typing import Annotated, List, Optional
 
 
 # Pydantic models (same as app.py)
@@ -49,70 +47,112 @@ class CourseStats(BaseModel):
     course_titles: List[str]
 
 
-def create_test_app(mock_rag_system):
-    """Create a test FastAPI app with mocked RAG system"""
-    app = FastAPI(title="Test Course Materials RAG System")
+def get_rag_system(request: Request):
+    """Return the RAG system shared by every request (same as app.py)"""
+    return request.app.state.rag_system
 
-    @app.post("/api/query", response_model=QueryResponse)
-    async def query_documents(request: QueryRequest):
-        """Process a query and return response with sources"""
-        try:
-            session_id = request.session_id
-            if not session_id:
-                session_id = mock_rag_system.session_manager.create_session()
 
-            answer, sources = mock_rag_system.query(request.query, session_id)
+RAGSystemDep = Annotated[Mock, Depends(get_rag_system)]
 
-            return QueryResponse(
-                answer=answer,
-                sources=[SourceCitation(**s) for s in sources],
-                session_id=session_id
-            )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+# Every test shares the session's event loop, like the client they talk to
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+# Canned answer for the tests that share one query response
+QUERY_ANSWER = "Response with multiple sources"
+QUERY_SOURCES = [
+    {"text": "Course A - Lesson 1", "url": "https://example.com/a"},
+    {"text": "Course B - Lesson 2", "url": None}
+]
+
+# Built once at import; fixtures attach the mocked RAG system via app.state
+app = FastAPI(title="Test Course Materials RAG System")
+
+
+@app.post("/api/query", response_model=QueryResponse)
+async def query_documents(request: QueryRequest, rag_system: RAGSystemDep):
+    """Process a query and return response with sources"""
+    try:
+        session_id = request.session_id
+        if not session_id:
+            session_id = rag_system.session_manager.create_session()
+
+        answer, sources = await rag_system.query(request.query, session_id)
+
+        return QueryResponse(
+            answer=answer,
+            sources=[SourceCitation(**s) for s in sources],
+            session_id=session_id
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-    @app.get("/api/courses", response_model=CourseStats)
-    async def get_course_stats():
-        """Get course analytics and statistics"""
+
+@app.post("/api/query/stream")
+async def query_documents_stream(request: QueryRequest, rag_system: RAGSystemDep):
+    """Process a query and stream the response as server-sent events"""
+    session_id = request.session_id
+    if not session_id:
+        session_id = rag_system.session_manager.create_session()
+
+    async def event_stream():
         try:
-            analytics = mock_rag_system.get_course_analytics()
-            return CourseStats(
-                total_courses=analytics["total_courses"],
-                course_titles=analytics["course_titles"]
-            )
+            async for event in rag_system.query_stream(request.query, session_id):
+                if event["type"] == "done":
+                    event = {**event, "session_id": session_id}
+                yield f"data: {json.dumps(event)}\n\n"
         except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+            yield f"data: {json.dumps({'type': 'error', 'detail': str(e)})}\n\n"
 
-    return app
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 
-class TestQueryEndpoint:
-    """Tests for POST /api/query endpoint"""
+@app.get("/api/courses", response_model=CourseStats)
+async def get_course_stats(rag_system: RAGSystemDep):
+    """Get course analytics and statistics"""
+    try:
+        analytics = rag_system.get_course_analytics()
+        return CourseStats(
+            total_courses=analytics["total_courses"],
+            course_titles=analytics["course_titles"]
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-    def test_query_returns_response_with_sources(self, mock_rag_system):
-        """Test that query endpoint returns answer and sources"""
-        app = create_test_app(mock_rag_system)
-        client = TestClient(app)
 
-        response = client.post(
-            "/api/query",
-            json={"query": "What is tool use?"}
-        )
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def api_client(shared_rag_system):
+    """One in-process async client on the test app, shared by every API test"""
+    app.state.rag_system = shared_rag_system
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
 
-        assert response.status_code == 200
-        data = response.json()
-        assert "answer" in data
-        assert "sources" in data
-        assert "session_id" in data
-        assert data["answer"] == "This is a test response about the course."
-        assert len(data["sources"]) == 1
 
-    def test_query_with_session_id_uses_provided_id(self, mock_rag_system):
-        """Test that provided session_id is used"""
-        app = create_test_app(mock_rag_system)
-        client = TestClient(app)
+@pytest_asyncio.fixture(scope="class", loop_scope="session")
+async def query_response(api_client, shared_rag_system):
+    """One successful /api/query round-trip whose JSON body several tests inspect"""
+    shared_rag_system.reset_mock(return_value=True, side_effect=True)
+    shared_rag_system.query = AsyncMock(return_value=(QUERY_ANSWER, QUERY_SOURCES))
+    shared_rag_system.session_manager.create_session.return_value = "new-session-id"
+
+    response = await api_client.post("/api/query", json={"query": "Test"})
+    assert response.status_code == 200
+    return response.json()
 
-        response = client.post(
+
+@pytest.fixture
+def client(api_client, mock_rag_system):
+    """The shared client, serving a freshly reset RAG system mock"""
+    return api_client
+
+
+class TestQueryEndpoint:
+    """Tests for POST /api/query endpoint"""
+
+    async def test_query_with_session_id_uses_provided_id(self, client, mock_rag_system):
+        """Test that provided session_id is used"""
+        response = await client.post(
             "/api/query",
             json={"query": "Follow up question", "session_id": "existing-session"}
         )
@@ -124,12 +164,9 @@ class TestQueryEndpoint:
             "Follow up question", "existing-session"
         )
 
-    def test_query_without_session_id_creates_new_session(self, mock_rag_system):
+    async def test_query_without_session_id_creates_new_session(self, client, mock_rag_system):
         """Test that new session is created when not provided"""
-        app = create_test_app(mock_rag_system)
-        client = TestClient(app)
-
-        response = client.post(
+        response = await client.post(
             "/api/query",
             json={"query": "New question"}
         )
@@ -139,92 +176,100 @@ class TestQueryEndpoint:
         assert data["session_id"] == "new-session-id"
         mock_rag_system.session_manager.create_session.assert_called_once()
 
-    def test_query_with_empty_query_returns_validation_error(self, mock_rag_system):
-        """Test that empty query returns validation error"""
-        app = create_test_app(mock_rag_system)
-        client = TestClient(app)
+    async def test_query_error_returns_500(self, client, mock_rag_system):
+        """Test that RAG system errors return 500"""
+        mock_rag_system.query.side_effect = Exception("Database error")
 
-        response = client.post(
+        response = await client.post(
             "/api/query",
-            json={"query": ""}
+            json={"query": "What is this?"}
         )
 
-        # FastAPI allows empty strings, so this should still work
-        assert response.status_code == 200
+        assert response.status_code == 500
+        assert "Database error" in response.json()["detail"]
 
-    def test_query_missing_query_field_returns_422(self, mock_rag_system):
-        """Test that missing query field returns 422 Unprocessable Entity"""
-        app = create_test_app(mock_rag_system)
-        client = TestClient(app)
 
-        response = client.post(
-            "/api/query",
-            json={}
-        )
+class TestQueryResponse:
+    """Tests for the body of a successful POST /api/query response"""
 
-        assert response.status_code == 422
+    async def test_query_returns_answer_and_session(self, query_response):
+        """Test that query endpoint returns the answer and a new session"""
+        assert query_response["answer"] == QUERY_ANSWER
+        assert query_response["session_id"] == "new-session-id"
 
-    def test_query_with_invalid_json_returns_422(self, mock_rag_system):
-        """Test that invalid JSON returns 422"""
-        app = create_test_app(mock_rag_system)
-        client = TestClient(app)
+    async def test_query_sources_format(self, query_response):
+        """Test that sources are properly formatted with text and url"""
+        sources = query_response["sources"]
+        assert len(sources) == 2
+        assert sources[0]["text"] == "Course A - Lesson 1"
+        assert sources[0]["url"] == "https://example.com/a"
+        assert sources[1]["url"] is None
 
-        response = client.post(
-            "/api/query",
-            content="not valid json",
-            headers={"Content-Type": "application/json"}
-        )
+    async def test_query_response_has_correct_schema(self, query_response):
+        """Test that query response matches expected schema"""
+        # Check all required fields exist
+        assert isinstance(query_response["answer"], str)
+        assert isinstance(query_response["sources"], list)
+        assert isinstance(query_response["session_id"], str)
+        # Check source structure
+        for source in query_response["sources"]:
+            assert "text" in source
+            assert "url" in source
 
-        assert response.status_code == 422
 
-    def test_query_error_returns_500(self, mock_rag_system):
-        """Test that RAG system errors return 500"""
-        mock_rag_system.query.side_effect = Exception("Database error")
-        app = create_test_app(mock_rag_system)
-        client = TestClient(app)
+class TestQueryStreamEndpoint:
+    """Tests for POST /api/query/stream endpoint"""
 
-        response = client.post(
-            "/api/query",
-            json={"query": "What is this?"}
-        )
+    @staticmethod
+    def _parse_events(body):
+        return [
+            json.loads(line[len("data: "):])
+            for line in body.split("\n\n")
+            if line.startswith("data: ")
+        ]
 
-        assert response.status_code == 500
-        assert "Database error" in response.json()["detail"]
+    async def test_stream_returns_text_events_then_done(self, client, mock_rag_system):
+        """Test that the stream emits text events followed by sources"""
+        async def fake_stream(query, session_id):
+            yield {"type": "text", "text": "Hello "}
+            yield {"type": "text", "text": "world"}
+            yield {"type": "done", "sources": [{"text": "Course A", "url": None}]}
 
-    def test_query_sources_format(self, mock_rag_system):
-        """Test that sources are properly formatted with text and url"""
-        mock_rag_system.query.return_value = (
-            "Response with multiple sources",
-            [
-                {"text": "Course A - Lesson 1", "url": "https://example.com/a"},
-                {"text": "Course B - Lesson 2", "url": None}
-            ]
-        )
-        app = create_test_app(mock_rag_system)
-        client = TestClient(app)
+        mock_rag_system.query_stream = fake_stream
 
-        response = client.post(
-            "/api/query",
-            json={"query": "Test query"}
+        response = await client.post(
+            "/api/query/stream",
+            json={"query": "Test", "session_id": "existing-session"}
         )
 
         assert response.status_code == 200
-        sources = response.json()["sources"]
-        assert len(sources) == 2
-        assert sources[0]["text"] == "Course A - Lesson 1"
-        assert sources[0]["url"] == "https://example.com/a"
-        assert sources[1]["url"] is None
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = self._parse_events(response.text)
+        assert [e["text"] for e in events[:-1]] == ["Hello ", "world"]
+        assert events[-1]["type"] == "done"
+        assert events[-1]["session_id"] == "existing-session"
+        assert events[-1]["sources"] == [{"text": "Course A", "url": None}]
+
+    async def test_stream_reports_errors_in_band(self, client, mock_rag_system):
+        """Test that failures mid-stream become an error event"""
+        async def failing_stream(query, session_id):
+            raise Exception("Database error")
+            yield
+
+        mock_rag_system.query_stream = failing_stream
+
+        response = await client.post("/api/query/stream", json={"query": "Test"})
+
+        events = self._parse_events(response.text)
+        assert events == [{"type": "error", "detail": "Database error"}]
 
 
 class TestCoursesEndpoint:
     """Tests for GET /api/courses endpoint"""
 
-    def test_get_courses_returns_stats(self, mock_rag_system):
+    async def test_get_courses_returns_stats(self, client):
         """Test that courses endpoint returns course statistics"""
-        app = create_test_app(mock_rag_system)
-        client = TestClient(app)
-
-        response = client.get("/api/courses")
+        response = await client.get("/api/courses")
 
         assert response.status_code == 200
         data = response.json()
@@ -232,29 +277,25 @@ class TestCoursesEndpoint:
         assert len(data["course_titles"]) == 3
         assert "Course A" in data["course_titles"]
 
-    def test_get_courses_empty_returns_zero(self, mock_rag_system):
+    async def test_get_courses_empty_returns_zero(self, client, mock_rag_system):
         """Test that empty course list returns zero count"""
         mock_rag_system.get_course_analytics.return_value = {
             "total_courses": 0,
             "course_titles": []
         }
-        app = create_test_app(mock_rag_system)
-        client = TestClient(app)
 
-        response = client.get("/api/courses")
+        response = await client.get("/api/courses")
 
         assert response.status_code == 200
         data = response.json()
         assert data["total_courses"] == 0
         assert data["course_titles"] == []
 
-    def test_get_courses_error_returns_500(self, mock_rag_system):
+    async def test_get_courses_error_returns_500(self, client, mock_rag_system):
         """Test that errors return 500"""
         mock_rag_system.get_course_analytics.side_effect = Exception("Vector DB error")
-        app = create_test_app(mock_rag_system)
-        client = TestClient(app)
 
-        response = client.get("/api/courses")
+        response = await client.get("/api/courses")
 
         assert response.status_code == 500
         assert "Vector DB error" in response.json()["detail"]
@@ -263,65 +304,35 @@ class TestCoursesEndpoint:
 class TestRequestValidation:
     """Tests for request validation"""
 
-    def test_query_with_extra_fields_ignores_them(self, mock_rag_system):
-        """Test that extra fields in request are ignored"""
-        app = create_test_app(mock_rag_system)
-        client = TestClient(app)
-
-        response = client.post(
-            "/api/query",
-            json={
-                "query": "Test",
-                "extra_field": "should be ignored",
-                "another": 123
-            }
-        )
-
-        assert response.status_code == 200
-
-    def test_query_with_wrong_type_session_id_returns_422(self, mock_rag_system):
-        """Test that wrong type for session_id returns 422"""
-        app = create_test_app(mock_rag_system)
-        client = TestClient(app)
-
-        response = client.post(
-            "/api/query",
-            json={"query": "Test", "session_id": 123}
-        )
-
+    @pytest.mark.parametrize("payload,expected", [
+        # FastAPI allows empty strings
+        pytest.param({"query": ""}, 200, id="empty_query"),
+        pytest.param({"query": "Test", "extra_field": "ignored", "another": 123}, 200, id="extra_fields_ignored"),
+        pytest.param({}, 422, id="missing_query"),
         # Pydantic v2 enforces strict typing for Optional[str]
-        assert response.status_code == 422
+        pytest.param({"query": "Test", "session_id": 123}, 422, id="wrong_type_session_id"),
+        pytest.param("not valid json", 422, id="invalid_json"),
+    ])
+    async def test_request_validation(self, client, payload, expected):
+        """Test that query requests are accepted or rejected with the right status"""
+        if isinstance(payload, str):
+            response = await client.post(
+                "/api/query",
+                content=payload,
+                headers={"Content-Type": "application/json"}
+            )
+        else:
+            response = await client.post("/api/query", json=payload)
+
+        assert response.status_code == expected
 
 
 class TestResponseFormat:
     """Tests for response format validation"""
 
-    def test_query_response_has_correct_schema(self, mock_rag_system):
-        """Test that query response matches expected schema"""
-        app = create_test_app(mock_rag_system)
-        client = TestClient(app)
-
-        response = client.post(
-            "/api/query",
-            json={"query": "Test"}
-        )
-
-        data = response.json()
-        # Check all required fields exist
-        assert isinstance(data["answer"], str)
-        assert isinstance(data["sources"], list)
-        assert isinstance(data["session_id"], str)
-        # Check source structure
-        for source in data["sources"]:
-            assert "text" in source
-            assert "url" in source
-
-    def test_courses_response_has_correct_schema(self, mock_rag_system):
+    async def test_courses_response_has_correct_schema(self, client):
         """Test that courses response matches expected schema"""
-        app = create_test_app(mock_rag_system)
-        client = TestClient(app)
-
-        response = client.get("/api/courses")
+        response = await client.get("/api/courses")
 
         data = response.json()
         assert isinstance(data["total_courses"], int)
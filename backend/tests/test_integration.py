@@ -5,63 +5,41 @@ These tests identify issues in the actual integration between components.
 """
 
 import os
-import sys
 
 import pytest
 
-# Add parent directory to path for imports
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Skip the whole module, instead of erroring at collection, without ChromaDB
+chromadb = pytest.importorskip("chromadb")
 
+from models import Course, CourseChunk, Lesson
+from search_tools import CourseSearchTool
+from vector_store import VectorStore
 
-class TestVectorStoreIntegration:
-    """Test VectorStore with real ChromaDB"""
-
-    def test_vector_store_initialization(self):
-        """Test that VectorStore can be initialized"""
-        import tempfile
+EXISTING_DB_PATH = "./chroma_db"
+HAS_EXISTING_DB = os.path.exists(EXISTING_DB_PATH)
 
-        from vector_store import VectorStore
-
-        with tempfile.TemporaryDirectory() as tmpdir:
-            store = VectorStore(
-                chroma_path=tmpdir, embedding_model="all-MiniLM-L6-v2", max_results=5
-            )
-
-            assert store.course_catalog is not None
-            assert store.course_content is not None
-
-    def test_vector_store_search_on_empty_db(self):
-        """Test search behavior on empty database"""
-        import tempfile
 
-        from vector_store import VectorStore
+def make_vector_store(chroma_path):
+    """Build a VectorStore with the settings the app uses"""
+    return VectorStore(
+        chroma_path=str(chroma_path),
+        embedding_model="all-MiniLM-L6-v2",
+        max_results=5,
+    )
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-            store = VectorStore(
-                chroma_path=tmpdir, embedding_model="all-MiniLM-L6-v2", max_results=5
-            )
 
-            # Search on empty database
-            results = store.search(query="test query")
+@pytest.fixture(scope="session")
+def empty_vector_store(tmp_path_factory):
+    """A real VectorStore that no test ever writes to"""
+    return make_vector_store(tmp_path_factory.mktemp("chroma_empty"))
 
-            # Should return empty results, NOT an error
-            assert results.error is None, f"Unexpected error: {results.error}"
-            assert results.is_empty()
 
-    def test_vector_store_add_and_search(self):
-        """Test adding content and searching it"""
-        import tempfile
-
-        from models import Course, CourseChunk, Lesson
-        from vector_store import VectorStore
-
-        with tempfile.TemporaryDirectory() as tmpdir:
-            store = VectorStore(
-                chroma_path=tmpdir, embedding_model="all-MiniLM-L6-v2", max_results=5
-            )
-
-            # Add a test course
-            course = Course(
+@pytest.fixture(scope="session")
+def sample_course_chunks():
+    """Two small courses, each with its chunks, as (Course, [CourseChunk])"""
+    return [
+        (
+            Course(
                 title="Test Course",
                 course_link="http://example.com",
                 instructor="Test Instructor",
@@ -72,50 +50,18 @@ class TestVectorStoreIntegration:
                         lesson_link="http://example.com/1",
                     )
                 ],
-            )
-            store.add_course_metadata(course)
-
-            # Add content chunks
-            chunks = [
+            ),
+            [
                 CourseChunk(
                     content="This is test content about machine learning and AI.",
                     course_title="Test Course",
                     lesson_number=1,
                     chunk_index=0,
                 )
-            ]
-            store.add_course_content(chunks)
-
-            # Search for the content
-            results = store.search(query="machine learning")
-
-            # Should find the content
-            assert results.error is None, f"Search error: {results.error}"
-            assert not results.is_empty(), "Expected to find results"
-            assert (
-                "machine learning" in results.documents[0].lower()
-                or "test content" in results.documents[0].lower()
-            )
-
-
-class TestCourseSearchToolIntegration:
-    """Test CourseSearchTool with real VectorStore"""
-
-    def test_search_tool_with_real_vector_store(self):
-        """Test search tool against real vector store"""
-        import tempfile
-
-        from models import Course, CourseChunk, Lesson
-        from search_tools import CourseSearchTool
-        from vector_store import VectorStore
-
-        with tempfile.TemporaryDirectory() as tmpdir:
-            store = VectorStore(
-                chroma_path=tmpdir, embedding_model="all-MiniLM-L6-v2", max_results=5
-            )
-
-            # Add test data
-            course = Course(
+            ],
+        ),
+        (
+            Course(
                 title="AI Fundamentals",
                 course_link="http://example.com/ai",
                 instructor="Dr. Test",
@@ -126,93 +72,121 @@ class TestCourseSearchToolIntegration:
                         lesson_link="http://example.com/ai/1",
                     )
                 ],
-            )
-            store.add_course_metadata(course)
-
-            chunks = [
+            ),
+            [
                 CourseChunk(
                     content="Artificial intelligence is the simulation of human intelligence by machines.",
                     course_title="AI Fundamentals",
                     lesson_number=1,
                     chunk_index=0,
                 )
-            ]
-            store.add_course_content(chunks)
+            ],
+        ),
+    ]
+
+
+@pytest.fixture(scope="session")
+def populated_vector_store(sample_course_chunks):
+    """A real in-memory VectorStore loaded once with the sample courses"""
+    # Chroma's in-memory clients skip sqlite but share one store per process,
+    # so only this fixture uses one; the empty store stays on disk to remain empty
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(
+            chromadb,
+            "PersistentClient",
+            lambda path, settings: chromadb.EphemeralClient(settings=settings),
+        )
+        store = make_vector_store("")
+    for course, chunks in sample_course_chunks:
+        store.add_course_metadata(course)
+        store.add_course_content(chunks)
+    return store
 
-            # Create search tool
-            search_tool = CourseSearchTool(store)
 
-            # Execute search
-            result = search_tool.execute(query="artificial intelligence")
+class TestVectorStoreIntegration:
+    """Test VectorStore with real ChromaDB"""
 
-            # Verify result
-            assert "AI Fundamentals" in result
-            assert "Lesson 1" in result
-            assert (
-                "artificial intelligence" in result.lower()
-                or "simulation" in result.lower()
-            )
+    def test_vector_store_initialization(self, empty_vector_store):
+        """Test that VectorStore can be initialized"""
+        assert empty_vector_store.course_catalog is not None
+        assert empty_vector_store.course_content is not None
 
-    def test_search_tool_on_empty_store(self):
-        """Test search tool behavior on empty store"""
-        import tempfile
+    def test_vector_store_search_on_empty_db(self, empty_vector_store):
+        """Test search behavior on empty database"""
+        # Search on empty database
+        results = empty_vector_store.search(query="test query")
 
-        from search_tools import CourseSearchTool
-        from vector_store import VectorStore
+        # Should return empty results, NOT an error
+        assert results.error is None, f"Unexpected error: {results.error}"
+        assert results.is_empty()
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-            store = VectorStore(
-                chroma_path=tmpdir, embedding_model="all-MiniLM-L6-v2", max_results=5
-            )
+    def test_vector_store_add_and_search(self, populated_vector_store):
+        """Test adding content and searching it"""
+        # Search for the content
+        results = populated_vector_store.search(query="machine learning")
+
+        # Should find the content
+        assert results.error is None, f"Search error: {results.error}"
+        assert not results.is_empty(), "Expected to find results"
+        assert (
+            "machine learning" in results.documents[0].lower()
+            or "test content" in results.documents[0].lower()
+        )
 
-            search_tool = CourseSearchTool(store)
-            result = search_tool.execute(query="anything")
 
-            # Should return "no results" message, not an error
-            assert "No relevant content found" in result
+class TestCourseSearchToolIntegration:
+    """Test CourseSearchTool with real VectorStore"""
 
+    def test_search_tool_with_real_vector_store(self, populated_vector_store):
+        """Test search tool against real vector store"""
+        # Create search tool
+        search_tool = CourseSearchTool(populated_vector_store)
+
+        # Execute search
+        result, sources = search_tool.execute(query="artificial intelligence")
+
+        # Verify result
+        assert "AI Fundamentals" in result
+        assert "Lesson 1" in result
+        assert sources and sources[0]["text"].startswith("AI Fundamentals")
+        assert (
+            "artificial intelligence" in result.lower()
+            or "simulation" in result.lower()
+        )
 
-class TestExistingDatabaseIntegration:
-    """Test against the existing ChromaDB database"""
+    def test_search_tool_on_empty_store(self, empty_vector_store):
+        """Test search tool behavior on empty store"""
+        search_tool = CourseSearchTool(empty_vector_store)
+        result, sources = search_tool.execute(query="anything")
 
-    def test_existing_database_has_courses(self):
-        """Test that the existing database has courses loaded"""
-        import os
+        # Should return "no results" message, not an error
+        assert "No relevant content found" in result
+        assert sources == []
 
-        from vector_store import VectorStore
 
-        chroma_path = "./chroma_db"
+@pytest.fixture(scope="module")
+def existing_store():
+    """The app's ./chroma_db store, opened once"""
+    return make_vector_store(EXISTING_DB_PATH)
 
-        # Skip if database doesn't exist
-        if not os.path.exists(chroma_path):
-            pytest.skip("No existing database found at ./chroma_db")
 
-        store = VectorStore(
-            chroma_path=chroma_path, embedding_model="all-MiniLM-L6-v2", max_results=5
-        )
+@pytest.mark.skipif(
+    not HAS_EXISTING_DB, reason="No existing database found at ./chroma_db"
+)
+class TestExistingDatabaseIntegration:
+    """Test against the existing ChromaDB database"""
 
-        course_count = store.get_course_count()
+    def test_existing_database_has_courses(self, existing_store):
+        """Test that the existing database has courses loaded"""
+        course_count = existing_store.get_course_count()
         print(f"Found {course_count} courses in database")
 
         assert course_count > 0, "Database should have courses loaded"
 
-    def test_existing_database_search_works(self):
+    def test_existing_database_search_works(self, existing_store):
         """Test that search works on existing database"""
-        import os
-
-        from vector_store import VectorStore
-
-        chroma_path = "./chroma_db"
-
-        if not os.path.exists(chroma_path):
-            pytest.skip("No existing database found at ./chroma_db")
-
-        store = VectorStore(
-            chroma_path=chroma_path, embedding_model="all-MiniLM-L6-v2", max_results=5
-        )
-
         # Search for common term
-        results = store.search(query="tool use")
+        results = existing_store.search(query="tool use")
 
         print(f"Search results: {len(results.documents)} documents")
         print(f"Error: {results.error}")
@@ -221,24 +195,10 @@ class TestExistingDatabaseIntegration:
 
         assert results.error is None, f"Search failed with error: {results.error}"
 
-    def test_existing_database_course_search_tool(self):
+    def test_existing_database_course_search_tool(self, existing_store):
         """Test CourseSearchTool on existing database"""
-        import os
-
-        from search_tools import CourseSearchTool
-        from vector_store import VectorStore
-
-        chroma_path = "./chroma_db"
-
-        if not os.path.exists(chroma_path):
-            pytest.skip("No existing database found at ./chroma_db")
-
-        store = VectorStore(
-            chroma_path=chroma_path, embedding_model="all-MiniLM-L6-v2", max_results=5
-        )
-
-        search_tool = CourseSearchTool(store)
-        result = search_tool.execute(query="What is tool use?")
+        search_tool = CourseSearchTool(existing_store)
+        result, _ = search_tool.execute(query="What is tool use?")
 
         print(f"Search tool result: {result[:200]}...")
 
@@ -8,93 +8,41 @@ These tests verify:
 4. Sources are correctly retrieved and returned
 """
 
-import os
-import sys
+import asyncio
+from unittest.mock import AsyncMock
 
-# Add parent directory to path for imports
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-from dataclasses import dataclass
-from unittest.mock import Mock, patch
-
-
-@dataclass
-class MockConfig:
-    """Mock configuration for testing"""
-
-    ANTHROPIC_API_KEY: str = "test-api-key"
-    ANTHROPIC_MODEL: str = "claude-sonnet-4-20250514"
-    EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
-    CHUNK_SIZE: int = 800
-    CHUNK_OVERLAP: int = 100
-    MAX_RESULTS: int = 5
-    MAX_HISTORY: int = 2
-    CHROMA_PATH: str = "./test_chroma_db"
+from vector_store import SearchResults
 
 
 class TestRAGSystemInitialization:
     """Test RAGSystem initialization and component setup"""
 
-    @patch("rag_system.VectorStore")
-    @patch("rag_system.AIGenerator")
-    @patch("rag_system.DocumentProcessor")
-    @patch("rag_system.SessionManager")
-    def test_rag_system_registers_search_tool(
-        self, mock_session, mock_doc_proc, mock_ai_gen, mock_vector_store
-    ):
+    def test_rag_system_registers_search_tool(self, rag):
         """Test that CourseSearchTool is registered on initialization"""
-        from rag_system import RAGSystem
-
-        config = MockConfig()
-        rag = RAGSystem(config)
-
         # Check that search tool is registered
         assert "search_course_content" in rag.tool_manager.tools
         assert rag.search_tool is not None
 
-    @patch("rag_system.VectorStore")
-    @patch("rag_system.AIGenerator")
-    @patch("rag_system.DocumentProcessor")
-    @patch("rag_system.SessionManager")
-    def test_rag_system_registers_outline_tool(
-        self, mock_session, mock_doc_proc, mock_ai_gen, mock_vector_store
-    ):
+    def test_rag_system_registers_outline_tool(self, rag):
         """Test that CourseOutlineTool is registered on initialization"""
-        from rag_system import RAGSystem
-
-        config = MockConfig()
-        rag = RAGSystem(config)
-
         # Check that outline tool is registered
         assert "get_course_outline" in rag.tool_manager.tools
         assert rag.outline_tool is not None
 
-    @patch("rag_system.VectorStore")
-    @patch("rag_system.AIGenerator")
-    @patch("rag_system.DocumentProcessor")
-    @patch("rag_system.SessionManager")
-    def test_tool_definitions_are_correct(
-        self, mock_session, mock_doc_proc, mock_ai_gen, mock_vector_store
-    ):
+    def test_tool_definitions_are_correct(self, rag):
         """Test that tool definitions have correct structure"""
-        from rag_system import RAGSystem
-
-        config = MockConfig()
-        rag = RAGSystem(config)
-
         definitions = rag.tool_manager.get_tool_definitions()
 
         assert len(definitions) == 2
+        by_name = {d["name"]: d for d in definitions}
 
         # Verify search tool definition
-        search_def = next(
-            d for d in definitions if d["name"] == "search_course_content"
-        )
+        search_def = by_name["search_course_content"]
         assert "input_schema" in search_def
         assert "query" in search_def["input_schema"]["properties"]
 
         # Verify outline tool definition
-        outline_def = next(d for d in definitions if d["name"] == "get_course_outline")
+        outline_def = by_name["get_course_outline"]
         assert "input_schema" in outline_def
         assert "course_name" in outline_def["input_schema"]["properties"]
 
@@ -102,233 +50,184 @@ class TestRAGSystemInitialization:
 class TestRAGSystemQuery:
     """Test RAGSystem.query() method"""
 
-    @patch("rag_system.VectorStore")
-    @patch("rag_system.AIGenerator")
-    @patch("rag_system.DocumentProcessor")
-    @patch("rag_system.SessionManager")
-    def test_query_calls_ai_generator_with_tools(
-        self, mock_session_class, mock_doc_proc, mock_ai_gen_class, mock_vector_store
+    async def test_query_calls_ai_generator_with_tools(
+        self, make_rag_system, mock_ai_generator
     ):
-        """Test that query passes tool definitions to AI generator"""
-        from rag_system import RAGSystem
-
-        # Setup mocks
-        mock_ai_generator = Mock()
-        mock_ai_gen_class.return_value = mock_ai_generator
-        mock_ai_generator.generate_response.return_value = "Test response"
-
-        mock_session_manager = Mock()
-        mock_session_class.return_value = mock_session_manager
-        mock_session_manager.get_conversation_history.return_value = None
-
-        config = MockConfig()
-        rag = RAGSystem(config)
+        """Test that tool definitions are registered once and the manager passed"""
+        rag = make_rag_system()
 
         # Act
-        response, sources = rag.query("What is tool use?", session_id="test-session")
+        response, sources = await rag.query(
+            "What is tool use?", session_id="test-session"
+        )
 
         # Assert
         mock_ai_generator.generate_response.assert_called_once()
         call_kwargs = mock_ai_generator.generate_response.call_args.kwargs
 
-        assert "tools" in call_kwargs
-        assert len(call_kwargs["tools"]) == 2
+        mock_ai_generator.set_tools.assert_called_once()
+        (tools,) = mock_ai_generator.set_tools.call_args.args
+        assert len(tools) == 2
+        assert "tools" not in call_kwargs
         assert "tool_manager" in call_kwargs
         assert call_kwargs["tool_manager"] == rag.tool_manager
 
-    @patch("rag_system.VectorStore")
-    @patch("rag_system.AIGenerator")
-    @patch("rag_system.DocumentProcessor")
-    @patch("rag_system.SessionManager")
-    def test_query_returns_response_and_sources(
-        self, mock_session_class, mock_doc_proc, mock_ai_gen_class, mock_vector_store
-    ):
+    async def test_query_returns_response_and_sources(self, rag):
         """Test that query returns both response and sources"""
-        from rag_system import RAGSystem
-
-        mock_ai_generator = Mock()
-        mock_ai_gen_class.return_value = mock_ai_generator
-        mock_ai_generator.generate_response.return_value = "Response text"
-
-        mock_session_manager = Mock()
-        mock_session_class.return_value = mock_session_manager
-        mock_session_manager.get_conversation_history.return_value = None
 
-        config = MockConfig()
-        rag = RAGSystem(config)
+        # Simulate the generator collecting sources from its tool calls
+        async def fake_generate(sources, **kwargs):
+            sources.append({"text": "Course A", "url": "http://example.com"})
+            return "Response text"
 
-        # Simulate sources being set by tool execution
-        rag.search_tool.last_sources = [
-            {"text": "Course A", "url": "http://example.com"}
-        ]
+        rag.ai_generator.generate_response.side_effect = fake_generate
 
         # Act
-        response, sources = rag.query("Test query")
+        response, sources = await rag.query("Test query")
 
         # Assert
         assert response == "Response text"
         assert len(sources) == 1
         assert sources[0]["text"] == "Course A"
 
-    @patch("rag_system.VectorStore")
-    @patch("rag_system.AIGenerator")
-    @patch("rag_system.DocumentProcessor")
-    @patch("rag_system.SessionManager")
-    def test_query_resets_sources_after_retrieval(
-        self, mock_session_class, mock_doc_proc, mock_ai_gen_class, mock_vector_store
-    ):
-        """Test that sources are reset after being retrieved"""
-        from rag_system import RAGSystem
+    async def test_concurrent_queries_keep_their_own_sources(self, rag):
+        """Test that interleaved queries never return each other's sources"""
+        rag.vector_store.search.side_effect = lambda query, **kwargs: SearchResults(
+            documents=[f"About {query}"],
+            metadata=[{"course_title": query, "lesson_number": 1}],
+            distances=[0.1],
+        )
 
-        mock_ai_generator = Mock()
-        mock_ai_gen_class.return_value = mock_ai_generator
-        mock_ai_generator.generate_response.return_value = "Response"
+        async def fake_generate(query, conversation_history, tool_manager, sources):
+            text, found = tool_manager.execute_tool(
+                "search_course_content", query=query
+            )
+            # Let the other query run its search before this one finishes
+            await asyncio.sleep(0)
+            sources.extend(found)
+            return f"answer {query}"
 
-        mock_session_manager = Mock()
-        mock_session_class.return_value = mock_session_manager
-        mock_session_manager.get_conversation_history.return_value = None
+        rag.ai_generator.generate_response.side_effect = fake_generate
 
-        config = MockConfig()
-        rag = RAGSystem(config)
+        # Act
+        (answer_a, sources_a), (answer_b, sources_b) = await asyncio.gather(
+            rag.query("CourseA"), rag.query("CourseB")
+        )
+
+        # Assert
+        assert answer_a == "answer CourseA"
+        assert [s["text"] for s in sources_a] == ["CourseA - Lesson 1"]
+        assert answer_b == "answer CourseB"
+        assert [s["text"] for s in sources_b] == ["CourseB - Lesson 1"]
 
-        rag.search_tool.last_sources = [{"text": "Test", "url": None}]
+    async def test_query_updates_session_history(self, rag):
+        """Test that query updates conversation history"""
+        rag.ai_generator.generate_response.return_value = "AI Response"
 
         # Act
-        rag.query("Test query")
+        await rag.query("User question", session_id="session-123")
 
-        # Assert - sources should be empty after query
-        assert rag.search_tool.last_sources == []
+        # Assert
+        rag.session_manager.add_exchange.assert_called_once_with(
+            "session-123", "User question", "AI Response"
+        )
 
-    @patch("rag_system.VectorStore")
-    @patch("rag_system.AIGenerator")
-    @patch("rag_system.DocumentProcessor")
-    @patch("rag_system.SessionManager")
-    def test_query_updates_session_history(
-        self, mock_session_class, mock_doc_proc, mock_ai_gen_class, mock_vector_store
-    ):
-        """Test that query updates conversation history"""
-        from rag_system import RAGSystem
+    async def test_query_includes_conversation_history(self, rag):
+        """Test that previous conversation history is passed to AI generator"""
+        rag.session_manager.get_conversation_history.return_value = "Previous Q&A"
 
-        mock_ai_generator = Mock()
-        mock_ai_gen_class.return_value = mock_ai_generator
-        mock_ai_generator.generate_response.return_value = "AI Response"
+        # Act
+        await rag.query("Follow up", session_id="session-456")
+
+        # Assert
+        call_kwargs = rag.ai_generator.generate_response.call_args.kwargs
+        assert call_kwargs["conversation_history"] == "Previous Q&A"
 
-        mock_session_manager = Mock()
-        mock_session_class.return_value = mock_session_manager
-        mock_session_manager.get_conversation_history.return_value = None
+    async def test_query_stream_yields_text_then_sources(self, rag):
+        """Test that streamed queries end with sources and update history"""
 
-        config = MockConfig()
-        rag = RAGSystem(config)
+        async def fake_stream(sources, **kwargs):
+            for chunk in ["Streamed ", "answer"]:
+                yield chunk
+            sources.append({"text": "Course A", "url": None})
+
+        rag.ai_generator.generate_response_stream = fake_stream
 
         # Act
-        rag.query("User question", session_id="session-123")
+        events = [e async for e in rag.query_stream("Question", "session-789")]
 
         # Assert
-        mock_session_manager.add_exchange.assert_called_once_with(
-            "session-123", "User question", "AI Response"
+        assert [e["text"] for e in events[:-1]] == ["Streamed ", "answer"]
+        assert events[-1] == {
+            "type": "done",
+            "sources": [{"text": "Course A", "url": None}],
+        }
+        rag.session_manager.add_exchange.assert_called_once_with(
+            "session-789", "Question", "Streamed answer"
         )
 
-    @patch("rag_system.VectorStore")
-    @patch("rag_system.AIGenerator")
-    @patch("rag_system.DocumentProcessor")
-    @patch("rag_system.SessionManager")
-    def test_query_includes_conversation_history(
-        self, mock_session_class, mock_doc_proc, mock_ai_gen_class, mock_vector_store
-    ):
-        """Test that previous conversation history is passed to AI generator"""
-        from rag_system import RAGSystem
-
-        mock_ai_generator = Mock()
-        mock_ai_gen_class.return_value = mock_ai_generator
-        mock_ai_generator.generate_response.return_value = "Response"
+    async def test_query_stream_resets_text_before_tool_round(self, rag):
+        """Test that text leading up to a tool call is dropped from the answer"""
 
-        mock_session_manager = Mock()
-        mock_session_class.return_value = mock_session_manager
-        mock_session_manager.get_conversation_history.return_value = "Previous Q&A"
+        async def fake_stream(sources, **kwargs):
+            for chunk in ["Let me search.", None, "Final ", "answer"]:
+                yield chunk
 
-        config = MockConfig()
-        rag = RAGSystem(config)
+        rag.ai_generator.generate_response_stream = fake_stream
 
         # Act
-        rag.query("Follow up", session_id="session-456")
+        events = [e async for e in rag.query_stream("Question", "session-789")]
 
         # Assert
-        call_kwargs = mock_ai_generator.generate_response.call_args.kwargs
-        assert call_kwargs["conversation_history"] == "Previous Q&A"
+        assert [e["type"] for e in events] == ["text", "reset", "text", "text", "done"]
+        rag.session_manager.add_exchange.assert_called_once_with(
+            "session-789", "Question", "Final answer"
+        )
 
 
 class TestRAGSystemIntegration:
     """Integration tests for the full RAG pipeline"""
 
-    @patch("rag_system.VectorStore")
-    @patch("rag_system.AIGenerator")
-    @patch("rag_system.DocumentProcessor")
-    @patch("rag_system.SessionManager")
-    def test_full_query_flow_with_tool_execution(
-        self,
-        mock_session_class,
-        mock_doc_proc,
-        mock_ai_gen_class,
-        mock_vector_store_class,
-    ):
+    async def test_full_query_flow_with_tool_execution(self, rag):
         """Test the complete query flow including tool execution"""
-        from rag_system import RAGSystem
-        from vector_store import SearchResults
-
         # Setup vector store mock
-        mock_vector_store = Mock()
-        mock_vector_store_class.return_value = mock_vector_store
-        mock_vector_store.search.return_value = SearchResults(
+        rag.vector_store.search.return_value = SearchResults(
             documents=["Content about the topic"],
             metadata=[{"course_title": "Test Course", "lesson_number": 1}],
             distances=[0.5],
             error=None,
         )
-        mock_vector_store.get_lesson_link.return_value = "http://example.com/lesson1"
+        rag.vector_store.get_lesson_link.return_value = "http://example.com/lesson1"
 
         # Setup AI generator that simulates tool use
-        mock_ai_generator = Mock()
-        mock_ai_gen_class.return_value = mock_ai_generator
-
-        def mock_generate(query, conversation_history, tools, tool_manager):
+        async def mock_generate(query, conversation_history, tool_manager, sources):
             # Simulate Claude calling the search tool
-            result = tool_manager.execute_tool("search_course_content", query="topic")
+            result, found = tool_manager.execute_tool(
+                "search_course_content", query="topic"
+            )
+            sources.extend(found)
             return f"Based on the search: {result[:50]}..."
 
-        mock_ai_generator.generate_response.side_effect = mock_generate
-
-        mock_session_manager = Mock()
-        mock_session_class.return_value = mock_session_manager
-        mock_session_manager.get_conversation_history.return_value = None
-
-        config = MockConfig()
-        rag = RAGSystem(config)
+        rag.ai_generator.generate_response = AsyncMock(side_effect=mock_generate)
 
         # Act
-        response, sources = rag.query("Tell me about the topic")
+        response, sources = await rag.query("Tell me about the topic")
 
         # Assert
         assert "Based on the search" in response
-        mock_vector_store.search.assert_called_once()
+        assert sources == [
+            {"text": "Test Course - Lesson 1", "url": "http://example.com/lesson1"}
+        ]
+        rag.vector_store.search.assert_called_once()
 
 
 class TestRAGSystemCourseAnalytics:
     """Test course analytics functionality"""
 
-    @patch("rag_system.VectorStore")
-    @patch("rag_system.AIGenerator")
-    @patch("rag_system.DocumentProcessor")
-    @patch("rag_system.SessionManager")
-    def test_get_course_analytics_returns_stats(
-        self, mock_session, mock_doc_proc, mock_ai_gen, mock_vector_store_class
-    ):
+    def test_get_course_analytics_returns_stats(self, rag):
         """Test that get_course_analytics returns correct data"""
-        from rag_system import RAGSystem
-
-        mock_vector_store = Mock()
-        mock_vector_store_class.return_value = mock_vector_store
-        mock_vector_store.get_course_count.return_value = 5
-        mock_vector_store.get_existing_course_titles.return_value = [
+        rag.vector_store.get_course_count.return_value = 5
+        rag.vector_store.get_existing_course_titles.return_value = [
             "Course A",
             "Course B",
             "Course C",
@@ -336,9 +235,6 @@ class TestRAGSystemCourseAnalytics:
             "Course E",
         ]
 
-        config = MockConfig()
-        rag = RAGSystem(config)
-
         # Act
         analytics = rag.get_course_analytics()
 
@@ -8,185 +8,151 @@ These tests verify:
 4. Results are formatted correctly
 """
 
-import os
-import sys
+import pytest
+from search_tools import CourseOutlineTool, CourseSearchTool, ToolManager
+from vector_store import SearchResults
 
-# Add parent directory to path for imports
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Lesson link states the source-tracking tests run under
+LESSON_LINKS = [None, "https://example.com/lesson1"]
 
-from unittest.mock import Mock
 
-from search_tools import CourseOutlineTool, CourseSearchTool, ToolManager
-from vector_store import SearchResults
+@pytest.fixture
+def store_with_link(mock_vector_store, request):
+    """mock_vector_store whose lessons all link to the parametrized URL"""
+    mock_vector_store.get_lesson_link.return_value = request.param
+    return mock_vector_store
 
 
 class TestCourseSearchToolExecute:
     """Test suite for CourseSearchTool.execute() method"""
 
-    def setup_method(self):
-        """Set up test fixtures"""
-        self.mock_vector_store = Mock()
-        self.search_tool = CourseSearchTool(self.mock_vector_store)
+    @pytest.fixture
+    def search_tool(self, mock_vector_store):
+        """A CourseSearchTool over the shared VectorStore mock"""
+        return CourseSearchTool(mock_vector_store)
 
-    def test_execute_with_valid_query_returns_formatted_results(self):
+    def test_execute_with_valid_query_returns_formatted_results(
+        self, search_tool, mock_vector_store, single_search_result
+    ):
         """Test that valid search results are formatted correctly"""
         # Arrange
-        mock_results = SearchResults(
-            documents=["This is lesson content about tool use."],
-            metadata=[{"course_title": "Test Course", "lesson_number": 1}],
-            distances=[0.5],
-            error=None,
-        )
-        self.mock_vector_store.search.return_value = mock_results
-        self.mock_vector_store.get_lesson_link.return_value = (
-            "https://example.com/lesson1"
-        )
+        mock_vector_store.search.return_value = single_search_result
 
         # Act
-        result = self.search_tool.execute(query="tool use")
+        result, sources = search_tool.execute(query="tool use")
 
         # Assert
+        assert sources == [{"text": "Test Course - Lesson 1", "url": None}]
         assert "Test Course" in result
         assert "Lesson 1" in result
         assert "This is lesson content about tool use." in result
-        self.mock_vector_store.search.assert_called_once_with(
+        mock_vector_store.search.assert_called_once_with(
             query="tool use", course_name=None, lesson_number=None
         )
 
-    def test_execute_with_no_results_returns_message(self):
+    def test_execute_with_no_results_returns_message(
+        self, search_tool, mock_vector_store, empty_search_results
+    ):
         """Test that empty results return appropriate message"""
         # Arrange
-        mock_results = SearchResults(
-            documents=[], metadata=[], distances=[], error=None
-        )
-        self.mock_vector_store.search.return_value = mock_results
+        mock_vector_store.search.return_value = empty_search_results
 
         # Act
-        result = self.search_tool.execute(query="nonexistent topic")
+        result, sources = search_tool.execute(query="nonexistent topic")
 
         # Assert
         assert "No relevant content found" in result
+        assert sources == []
 
-    def test_execute_with_search_error_returns_error_message(self):
+    def test_execute_with_search_error_returns_error_message(
+        self, search_tool, mock_vector_store, error_search_results
+    ):
         """Test that search errors are properly returned"""
         # Arrange
-        mock_results = SearchResults(
-            documents=[],
-            metadata=[],
-            distances=[],
-            error="Search error: Database connection failed",
-        )
-        self.mock_vector_store.search.return_value = mock_results
+        mock_vector_store.search.return_value = error_search_results
 
         # Act
-        result = self.search_tool.execute(query="any query")
+        result, sources = search_tool.execute(query="any query")
 
         # Assert
         assert "Search error" in result
         assert "Database connection failed" in result
-
-    def test_execute_with_course_filter(self):
-        """Test that course_name filter is passed correctly"""
+        assert sources == []
+
+    @pytest.mark.parametrize(
+        "filters, course_title, lesson_number, expected_substrings",
+        [
+            pytest.param(
+                {"course_name": "MCP"}, "MCP Course", 2, ["MCP Course"], id="course"
+            ),
+            pytest.param(
+                {"lesson_number": 3}, "Test Course", 3, ["Lesson 3"], id="lesson"
+            ),
+            pytest.param(
+                {"course_name": "Computer Use", "lesson_number": 5},
+                "Computer Use",
+                5,
+                ["Computer Use", "Lesson 5"],
+                id="course_and_lesson",
+            ),
+        ],
+    )
+    def test_execute_passes_filters(
+        self,
+        search_tool,
+        mock_vector_store,
+        filters,
+        course_title,
+        lesson_number,
+        expected_substrings,
+    ):
+        """Test that course_name and lesson_number filters are passed through"""
         # Arrange
-        mock_results = SearchResults(
+        mock_vector_store.search.return_value = SearchResults(
             documents=["Filtered content"],
-            metadata=[{"course_title": "MCP Course", "lesson_number": 2}],
+            metadata=[{"course_title": course_title, "lesson_number": lesson_number}],
             distances=[0.3],
             error=None,
         )
-        self.mock_vector_store.search.return_value = mock_results
-        self.mock_vector_store.get_lesson_link.return_value = None
 
         # Act
-        result = self.search_tool.execute(query="MCP", course_name="MCP")
+        result, _ = search_tool.execute(query="q", **filters)
 
         # Assert
-        self.mock_vector_store.search.assert_called_once_with(
-            query="MCP", course_name="MCP", lesson_number=None
-        )
-        assert "MCP Course" in result
-
-    def test_execute_with_lesson_filter(self):
-        """Test that lesson_number filter is passed correctly"""
-        # Arrange
-        mock_results = SearchResults(
-            documents=["Lesson 3 content"],
-            metadata=[{"course_title": "Test Course", "lesson_number": 3}],
-            distances=[0.2],
-            error=None,
-        )
-        self.mock_vector_store.search.return_value = mock_results
-        self.mock_vector_store.get_lesson_link.return_value = None
-
-        # Act
-        result = self.search_tool.execute(query="content", lesson_number=3)
-
-        # Assert
-        self.mock_vector_store.search.assert_called_once_with(
-            query="content", course_name=None, lesson_number=3
-        )
-        assert "Lesson 3" in result
-
-    def test_execute_with_both_filters(self):
-        """Test that both course_name and lesson_number filters work together"""
-        # Arrange
-        mock_results = SearchResults(
-            documents=["Specific content"],
-            metadata=[{"course_title": "Computer Use", "lesson_number": 5}],
-            distances=[0.1],
-            error=None,
-        )
-        self.mock_vector_store.search.return_value = mock_results
-        self.mock_vector_store.get_lesson_link.return_value = (
-            "https://example.com/lesson5"
-        )
-
-        # Act
-        result = self.search_tool.execute(
-            query="computer use", course_name="Computer Use", lesson_number=5
-        )
-
-        # Assert
-        self.mock_vector_store.search.assert_called_once_with(
-            query="computer use", course_name="Computer Use", lesson_number=5
-        )
-        assert "Computer Use" in result
-        assert "Lesson 5" in result
-
-    def test_format_results_tracks_sources(self):
-        """Test that sources are properly tracked after formatting"""
+        mock_vector_store.search.assert_called_once_with(
+            query="q",
+            course_name=filters.get("course_name"),
+            lesson_number=filters.get("lesson_number"),
+        )
+        for substring in expected_substrings:
+            assert substring in result
+
+    @pytest.mark.parametrize("store_with_link", LESSON_LINKS, indirect=True)
+    def test_format_results_returns_sources(
+        self, search_tool, store_with_link, sample_search_results
+    ):
+        """Test that each result's source is returned with the formatted text"""
         # Arrange
-        mock_results = SearchResults(
-            documents=["Content 1", "Content 2"],
-            metadata=[
-                {"course_title": "Course A", "lesson_number": 1},
-                {"course_title": "Course A", "lesson_number": 2},
-            ],
-            distances=[0.1, 0.2],
-            error=None,
-        )
-        self.mock_vector_store.search.return_value = mock_results
-        self.mock_vector_store.get_lesson_link.return_value = (
-            "https://example.com/lesson"
-        )
+        store_with_link.search.return_value = sample_search_results
 
         # Act
-        self.search_tool.execute(query="test")
+        _, sources = search_tool.execute(query="test")
 
         # Assert
-        assert len(self.search_tool.last_sources) == 2
-        assert self.search_tool.last_sources[0]["text"] == "Course A - Lesson 1"
-
-    def test_no_results_with_course_filter_shows_filter_info(self):
+        assert len(sources) == 2
+        assert sources[0]["text"] == "Tool Use Course - Lesson 1"
+        link = store_with_link.get_lesson_link.return_value
+        assert [s["url"] for s in sources] == [link, link]
+
+    def test_no_results_with_course_filter_shows_filter_info(
+        self, search_tool, mock_vector_store, empty_search_results
+    ):
         """Test that no results message includes filter information"""
         # Arrange
-        mock_results = SearchResults(
-            documents=[], metadata=[], distances=[], error=None
-        )
-        self.mock_vector_store.search.return_value = mock_results
+        mock_vector_store.search.return_value = empty_search_results
 
         # Act
-        result = self.search_tool.execute(query="test", course_name="Specific Course")
+        result, _ = search_tool.execute(query="test", course_name="Specific Course")
 
         # Assert
         assert "No relevant content found" in result
@@ -196,10 +162,9 @@ class TestCourseSearchToolExecute:
 class TestCourseSearchToolDefinition:
     """Test the tool definition is correct"""
 
-    def test_get_tool_definition_has_required_fields(self):
+    def test_get_tool_definition_has_required_fields(self, mock_vector_store):
         """Test that tool definition has all required Anthropic fields"""
-        mock_store = Mock()
-        tool = CourseSearchTool(mock_store)
+        tool = CourseSearchTool(mock_vector_store)
         definition = tool.get_tool_definition()
 
         assert "name" in definition
@@ -214,106 +179,76 @@ class TestCourseSearchToolDefinition:
 class TestToolManager:
     """Test ToolManager functionality"""
 
-    def test_register_tool_stores_tool(self):
+    @pytest.fixture
+    def tool_manager(self, mock_vector_store):
+        """A ToolManager with both course tools registered"""
+        manager = ToolManager()
+        manager.register_tool(CourseSearchTool(mock_vector_store))
+        manager.register_tool(CourseOutlineTool(mock_vector_store))
+        return manager
+
+    def test_register_tool_stores_tool(self, mock_vector_store):
         """Test that tools are properly registered"""
         manager = ToolManager()
-        mock_store = Mock()
-        tool = CourseSearchTool(mock_store)
+        tool = CourseSearchTool(mock_vector_store)
 
         manager.register_tool(tool)
 
         assert "search_course_content" in manager.tools
         assert manager.tools["search_course_content"] == tool
 
-    def test_get_tool_definitions_returns_all_tools(self):
+    def test_get_tool_definitions_returns_all_tools(self, tool_manager):
         """Test that all tool definitions are returned"""
-        manager = ToolManager()
-        mock_store = Mock()
-        search_tool = CourseSearchTool(mock_store)
-        outline_tool = CourseOutlineTool(mock_store)
-
-        manager.register_tool(search_tool)
-        manager.register_tool(outline_tool)
-
-        definitions = manager.get_tool_definitions()
+        definitions = tool_manager.get_tool_definitions()
 
         assert len(definitions) == 2
         names = [d["name"] for d in definitions]
         assert "search_course_content" in names
         assert "get_course_outline" in names
 
-    def test_execute_tool_calls_correct_tool(self):
+    def test_execute_tool_calls_correct_tool(
+        self, tool_manager, mock_vector_store, single_search_result
+    ):
         """Test that execute_tool dispatches to the right tool"""
-        manager = ToolManager()
-        mock_store = Mock()
-        mock_results = SearchResults(
-            documents=["test content"],
-            metadata=[{"course_title": "Test", "lesson_number": 1}],
-            distances=[0.5],
-            error=None,
-        )
-        mock_store.search.return_value = mock_results
-        mock_store.get_lesson_link.return_value = None
-
-        tool = CourseSearchTool(mock_store)
-        manager.register_tool(tool)
+        mock_vector_store.search.return_value = single_search_result
 
-        result = manager.execute_tool("search_course_content", query="test")
+        result, _ = tool_manager.execute_tool("search_course_content", query="test")
 
         assert "Test" in result
-        mock_store.search.assert_called_once()
+        mock_vector_store.search.assert_called_once()
 
-    def test_execute_tool_unknown_tool_returns_error(self):
+    def test_execute_tool_unknown_tool_returns_error(self, tool_manager):
         """Test that unknown tool names return error message"""
-        manager = ToolManager()
-
-        result = manager.execute_tool("unknown_tool", query="test")
+        result, sources = tool_manager.execute_tool("unknown_tool", query="test")
 
         assert "not found" in result
+        assert sources == []
 
-    def test_get_last_sources_returns_sources(self):
-        """Test that sources are retrieved from tools"""
-        manager = ToolManager()
-        mock_store = Mock()
-        mock_results = SearchResults(
-            documents=["content"],
-            metadata=[{"course_title": "Test Course", "lesson_number": 1}],
-            distances=[0.5],
-            error=None,
-        )
-        mock_store.search.return_value = mock_results
-        mock_store.get_lesson_link.return_value = "https://example.com"
-
-        tool = CourseSearchTool(mock_store)
-        manager.register_tool(tool)
+    @pytest.mark.parametrize("store_with_link", LESSON_LINKS, indirect=True)
+    def test_execute_tool_returns_sources(
+        self, tool_manager, store_with_link, single_search_result
+    ):
+        """Test that a tool call's sources are returned along with its text"""
+        store_with_link.search.return_value = single_search_result
 
-        # Execute to generate sources
-        manager.execute_tool("search_course_content", query="test")
+        _, sources = tool_manager.execute_tool("search_course_content", query="test")
 
-        sources = manager.get_last_sources()
         assert len(sources) == 1
         assert sources[0]["text"] == "Test Course - Lesson 1"
-
-    def test_reset_sources_clears_all_sources(self):
-        """Test that reset_sources clears sources from all tools"""
-        manager = ToolManager()
-        mock_store = Mock()
-        mock_results = SearchResults(
-            documents=["content"],
-            metadata=[{"course_title": "Test", "lesson_number": 1}],
-            distances=[0.5],
-            error=None,
-        )
-        mock_store.search.return_value = mock_results
-        mock_store.get_lesson_link.return_value = None
-
-        tool = CourseSearchTool(mock_store)
-        manager.register_tool(tool)
-
-        # Execute to generate sources
-        manager.execute_tool("search_course_content", query="test")
-        assert len(manager.get_last_sources()) > 0
-
-        # Reset and verify
-        manager.reset_sources()
-        assert len(manager.get_last_sources()) == 0
+        assert sources[0]["url"] == store_with_link.get_lesson_link.return_value
+
+    def test_execute_tool_sources_are_per_call(
+        self, tool_manager, mock_vector_store, single_search_result
+    ):
+        """Test that sources are not kept on the tools between calls"""
+        mock_vector_store.search.side_effect = [
+            single_search_result,
+            SearchResults(documents=[], metadata=[], distances=[]),
+        ]
+
+        _, first = tool_manager.execute_tool("search_course_content", query="a")
+        _, second = tool_manager.execute_tool("search_course_content", query="b")
+
+        assert len(first) == 1
+        assert second == []
+        assert not hasattr(tool_manager.tools["search_course_content"], "last_sources")
@@ -66,8 +66,11 @@ async function sendMessage() {
     chatMessages.appendChild(loadingMessage);
     chatMessages.scrollTop = chatMessages.scrollHeight;
 
+    // Assistant message that is filled in as the answer streams
+    let streamingMessage = null;
+
     try {
-        const response = await fetch(`${API_URL}/query`, {
+        const response = await fetch(`${API_URL}/query/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -80,20 +83,60 @@ async function sendMessage() {
 
         if (!response.ok) throw new Error('Query failed');
 
-        const data = await response.json();
-        
-        // Update session ID if new
-        if (!currentSessionId) {
-            currentSessionId = data.session_id;
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let answer = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+
+            // Server-sent events are separated by a blank line
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+
+            for (const rawEvent of events) {
+                if (!rawEvent.startsWith('data: ')) continue;
+                const event = JSON.parse(rawEvent.slice(6));
+
+                if (event.type === 'text') {
+                    answer += event.text;
+                    if (!streamingMessage) {
+                        loadingMessage.remove();
+                        streamingMessage = createStreamingMessage();
+                    }
+                    streamingMessage.querySelector('.message-content').innerHTML = marked.parse(answer);
+                    chatMessages.scrollTop = chatMessages.scrollHeight;
+                } else if (event.type === 'reset') {
+                    // Text so far led up to a tool call; show loading until the answer
+                    answer = '';
+                    if (streamingMessage) {
+                        streamingMessage.remove();
+                        streamingMessage = null;
+                        chatMessages.appendChild(loadingMessage);
+                    }
+                } else if (event.type === 'done') {
+                    // Update session ID if new
+                    if (!currentSessionId) {
+                        currentSessionId = event.session_id;
+                    }
+
+                    // Re-render the finished answer with its sources
+                    loadingMessage.remove();
+                    if (streamingMessage) streamingMessage.remove();
+                    addMessage(answer, 'assistant', event.sources);
+                } else if (event.type === 'error') {
+                    throw new Error(event.detail);
+                }
+            }
         }
 
-        // Replace loading message with response
-        loadingMessage.remove();
-        addMessage(data.answer, 'assistant', data.sources);
-
     } catch (error) {
-        // Replace loading message with error
+        // Replace loading or partial message with error
         loadingMessage.remove();
+        if (streamingMessage) streamingMessage.remove();
         addMessage(`Error: ${error.message}`, 'assistant');
     } finally {
         chatInput.disabled = false;
@@ -117,6 +160,14 @@ function createLoadingMessage() {
     return messageDiv;
 }
 
+function createStreamingMessage() {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'message assistant';
+    messageDiv.innerHTML = '<div class="message-content"></div>';
+    chatMessages.appendChild(messageDiv);
+    return messageDiv;
+}
+
 function addMessage(content, type, sources = null, isWelcome = false) {
     const messageId = Date.now();
     const messageDiv = document.createElement('div');